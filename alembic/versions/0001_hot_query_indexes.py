@@ -0,0 +1,46 @@
+"""Indexes for the hot queries
+
+Tables are created by Base.metadata.create_all on startup, which only adds indexes to new tables. This
+adds them to existing databases; if_not_exists keeps it safe on databases created after the models
+declared them.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Feed and watchlist lookups by itch.io game ID
+    op.create_index('ix_games_game_id', 'games', ['game_id'], if_not_exists=True)
+    # refresh_version's latest version check
+    op.create_index(
+        'ix_game_versions_latest_game_id_version', 'game_versions', ['game_id', 'version'],
+        postgresql_where=sa.text('is_latest'), if_not_exists=True
+    )
+    # notify_about_updates' scan for new latest versions
+    op.create_index(
+        'ix_game_versions_latest_created_at', 'game_versions', ['created_at'],
+        postgresql_where=sa.text('is_latest'), if_not_exists=True
+    )
+    op.create_index('ix_discord_users_discord_id', 'discord_users', ['discord_id'], if_not_exists=True)
+    # map_language_code compares lower(game_language_key)
+    op.create_index(
+        'ix_language_mappings_lower_game_language_key', 'language_mappings',
+        [sa.text('lower(game_language_key)')], if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index('ix_language_mappings_lower_game_language_key', table_name='language_mappings')
+    op.drop_index('ix_discord_users_discord_id', table_name='discord_users')
+    op.drop_index('ix_game_versions_latest_created_at', table_name='game_versions')
+    op.drop_index('ix_game_versions_latest_game_id_version', table_name='game_versions')
+    op.drop_index('ix_games_game_id', table_name='games')
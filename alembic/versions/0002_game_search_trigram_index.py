@@ -0,0 +1,28 @@
+"""Trigram index for /search over game name, authors and tags
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+# Same expression as models.SEARCH_DOCUMENT, copied so the revision doesn't change with the models
+SEARCH_DOCUMENT = "lower(coalesce(games.name, '') || ' ' || coalesce(games.authors, '') || ' ' || coalesce(games.tags, ''))"
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index(
+        'ix_games_search_trgm', 'games', [sa.text(f'({SEARCH_DOCUMENT}) gin_trgm_ops')],
+        postgresql_using='gin', if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index('ix_games_search_trgm', table_name='games')
@@ -0,0 +1,27 @@
+"""Per-game next check times for the adaptive nightly refreshes
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # NULL means never scheduled, such games are due on the next run
+    op.execute('ALTER TABLE games ADD COLUMN IF NOT EXISTS next_page_check_at TIMESTAMP WITHOUT TIME ZONE')
+    op.execute('ALTER TABLE games ADD COLUMN IF NOT EXISTS next_version_check_at TIMESTAMP WITHOUT TIME ZONE')
+    op.create_index('ix_games_next_page_check_at', 'games', ['next_page_check_at'], if_not_exists=True)
+    op.create_index('ix_games_next_version_check_at', 'games', ['next_version_check_at'], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_games_next_version_check_at', table_name='games')
+    op.drop_index('ix_games_next_page_check_at', table_name='games')
+    op.drop_column('games', 'next_version_check_at')
+    op.drop_column('games', 'next_page_check_at')
@@ -0,0 +1,48 @@
+"""Latest version per game, kept up to date by the application
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+# Same statements as models.BACKFILL_LATEST_VERSIONS, copied so the revision doesn't change with the models
+BACKFILL_LATEST_VERSIONS = [
+    """
+    INSERT INTO latest_game_version (game_id, game_version_id, created_at)
+    SELECT DISTINCT ON (game_id) game_id, id, created_at
+    FROM game_versions
+    ORDER BY game_id, id DESC
+    ON CONFLICT (game_id) DO UPDATE
+    SET game_version_id = excluded.game_version_id, created_at = excluded.created_at
+    """,
+    """
+    UPDATE game_versions
+    SET is_latest = (id IN (SELECT game_version_id FROM latest_game_version))
+    WHERE is_latest <> (id IN (SELECT game_version_id FROM latest_game_version))
+    """,
+]
+
+
+def upgrade():
+    op.create_table(
+        'latest_game_version',
+        sa.Column('game_id', sa.Integer, sa.ForeignKey('games.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('game_version_id', sa.BigInteger, sa.ForeignKey('game_versions.id', ondelete='CASCADE'),
+                  nullable=False, unique=True),
+        sa.Column('created_at', sa.DateTime),
+        if_not_exists=True
+    )
+    op.create_index('ix_latest_game_version_created_at', 'latest_game_version', ['created_at'], if_not_exists=True)
+    for statement in BACKFILL_LATEST_VERSIONS:
+        op.execute(statement)
+
+
+def downgrade():
+    op.drop_table('latest_game_version')
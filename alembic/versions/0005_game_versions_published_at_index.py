@@ -0,0 +1,22 @@
+"""Index for the recent version history of a game, read after every refresh to schedule the next
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_game_versions_game_id_published_at', 'game_versions', ['game_id', 'published_at'], if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index('ix_game_versions_game_id_published_at', table_name='game_versions')
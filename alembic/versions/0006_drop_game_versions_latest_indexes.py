@@ -0,0 +1,29 @@
+"""Drop the partial is_latest indexes, latest version reads go through latest_game_version
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_index('ix_game_versions_latest_created_at', table_name='game_versions', if_exists=True)
+    op.drop_index('ix_game_versions_latest_game_id_version', table_name='game_versions', if_exists=True)
+
+
+def downgrade():
+    op.create_index(
+        'ix_game_versions_latest_game_id_version', 'game_versions', ['game_id', 'version'],
+        postgresql_where=sa.text('is_latest'), if_not_exists=True
+    )
+    op.create_index(
+        'ix_game_versions_latest_created_at', 'game_versions', ['created_at'],
+        postgresql_where=sa.text('is_latest'), if_not_exists=True
+    )
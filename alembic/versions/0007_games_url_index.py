@@ -0,0 +1,20 @@
+"""Index games by URL to identify feed events without a game cell
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_games_url', 'games', ['url'], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_games_url', table_name='games')
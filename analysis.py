@@ -0,0 +1,161 @@
+import concurrent.futures
+import datetime
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+from models import Session, Game, PendingAnalysis, cache_script_stats, store_version_stats, store_file_stats, \
+    get_previous_file_stats
+
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', os.cpu_count() or 1))
+ANALYSIS_MAX_ATTEMPTS = 3
+ANALYSIS_POLL_INTERVAL = 30
+
+
+def analyse_upload(game_url, game_engine, itch_api_key, upload, previous_files):
+    """
+    Download an upload and run the script analysis on it. Runs inside a worker process, so it
+    only works on a detached Game and never touches the database.
+    """
+    game = Game(url=game_url, game_engine=game_engine)
+    game.error = None
+    stats = game.get_script_stats(itch_api_key, upload, previous_files)
+    return {
+        'stats': stats,
+        'game_engine': game.game_engine,
+        'error': game.error
+    }
+
+
+class AnalysisPool:
+    """
+    Drains the pending_analyses queue with a pool of worker processes, so that long running
+    Ren'Py analyses don't block the scheduler thread
+    """
+
+    def __init__(self, itch_api_key: str, workers: int = ANALYSIS_WORKERS):
+        self.itch_api_key = itch_api_key
+        self.workers = workers
+        self.executor = None
+        self.in_flight = {}
+
+    def run(self) -> None:
+        thread = threading.Thread(target=self.dispatcher, daemon=True)
+        thread.start()
+
+    def create_executor(self):
+        # Fork explicitly: spawned workers would re-import the bot's __main__ module
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('fork')
+        )
+
+    def dispatcher(self):
+        print(f"\n[AnalysisPool] Start with {self.workers} workers\n")
+        self.executor = self.create_executor()
+        while True:
+            self.dispatch()
+
+    def dispatch(self):
+        """Submit pending analyses to free workers and wait for the next to complete"""
+        try:
+            self.submit_pending()
+        except Exception as exception:
+            print(f"\n[AnalysisPool] Error: {exception}\n")
+
+        if not self.in_flight:
+            time.sleep(ANALYSIS_POLL_INTERVAL)
+            return
+
+        done, _ = concurrent.futures.wait(
+            self.in_flight.values(),
+            timeout=ANALYSIS_POLL_INTERVAL,
+            return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        for pending_id, future in list(self.in_flight.items()):
+            if future in done:
+                del self.in_flight[pending_id]
+                try:
+                    self.complete(pending_id, future)
+                except Exception as exception:
+                    # E.g. two uploads with the same contents both caching their stats
+                    print(f"\n[AnalysisPool] Storing analysis of {pending_id} failed: {exception}\n")
+                    self.fail(pending_id, str(exception))
+
+    def submit_pending(self):
+        free_workers = self.workers - len(self.in_flight)
+        if free_workers <= 0:
+            return
+
+        with Session() as session:
+            pending_analyses = session.query(PendingAnalysis, Game) \
+                .join(Game, PendingAnalysis.game_id == Game.id) \
+                .filter(PendingAnalysis.attempts < ANALYSIS_MAX_ATTEMPTS) \
+                .order_by(PendingAnalysis.id)
+            if self.in_flight:
+                pending_analyses = pending_analyses.filter(PendingAnalysis.id.notin_(list(self.in_flight)))
+
+            for pending, game in pending_analyses.limit(free_workers).all():
+                print(f"\n[AnalysisPool] Analysing upload {pending.upload['id']} of game {game.id}\n")
+                # Files unchanged since the previous version are summed up instead of counted again
+                previous_files = get_previous_file_stats(session, game.id, pending.game_version_id)
+                self.in_flight[pending.id] = self.executor.submit(
+                    analyse_upload, game.url, game.game_engine, self.itch_api_key, pending.upload, previous_files
+                )
+
+    def complete(self, pending_id, future):
+        with Session() as session:
+            pending = session.get(PendingAnalysis, pending_id)
+            if not pending:
+                return
+
+            try:
+                result = future.result()
+            except BrokenProcessPool as exception:
+                # A worker died (e.g. OOM killed), the whole pool has to be replaced
+                print(f"\n[AnalysisPool] Worker pool broken: {exception}\n")
+                self.executor.shutdown(wait=False)
+                self.executor = self.create_executor()
+                result = None
+                pending.error = str(exception)
+            except Exception as exception:
+                print(f"\n[AnalysisPool] Analysis of {pending_id} failed: {exception}\n")
+                result = None
+                pending.error = str(exception)
+
+            if result is not None and result['error']:
+                # get_script_stats reports download errors (network, md5 mismatch, size cap) as empty stats
+                print(f"\n[AnalysisPool] Analysis of {pending_id} failed: {result['error']}\n")
+                pending.error = result['error']
+                result = None
+
+            if result is None:
+                pending.attempts += 1
+                pending.updated_at = datetime.datetime.utcnow()
+                session.commit()
+                return
+
+            game = session.get(Game, pending.game_id)
+            game.game_engine = result['game_engine']
+            cache_script_stats(session, pending.upload, result['stats'])
+            store_version_stats(session, game, pending.game_version_id, result['stats'])
+            if result['stats'].get('files'):
+                store_file_stats(session, pending.game_version_id, result['stats']['files'])
+            session.delete(pending)
+            session.commit()
+
+    @staticmethod
+    def fail(pending_id, error):
+        """Count a failed attempt in a fresh session, after the one storing the results broke"""
+        try:
+            with Session() as session:
+                pending = session.get(PendingAnalysis, pending_id)
+                if pending:
+                    pending.attempts += 1
+                    pending.error = error
+                    pending.updated_at = datetime.datetime.utcnow()
+                    session.commit()
+        except Exception as exception:
+            print(f"\n[AnalysisPool] Error: {exception}\n")
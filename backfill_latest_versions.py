@@ -0,0 +1,10 @@
+# Rebuilds the latest_game_version table and the is_latest flags, e.g. after importing versions by hand
+from models import engine, Base, Session, backfill_latest_versions
+
+Base.metadata.create_all(engine)
+
+with Session() as session:
+    backfill_latest_versions(session)
+    session.commit()
+
+print("\n[backfill_latest_versions] Done\n")
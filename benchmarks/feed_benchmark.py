@@ -0,0 +1,81 @@
+"""
+Compare the lxml feed extractor against the previous BeautifulSoup parsing of my-feed pages.
+
+Usage: python benchmarks/feed_benchmark.py [feed page JSON file]
+
+Without arguments the fixture page from tests/fixtures is used. Both paths parse the page repeatedly and
+their extracted events are compared.
+"""
+import json
+import os
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from extractors import extract_feed_events  # noqa: E402
+
+FIXTURE_PAGE = os.path.join(ROOT, 'tests', 'fixtures', 'feed_page.json')
+ITERATIONS = 200
+
+
+def extract_feed_events_soup(content):
+    """The parsing previously done inline in Scheduler.process_feed_page"""
+    events = []
+    soup = BeautifulSoup(content, 'html.parser')
+    for event_row in soup.find_all("div", {"class": "event_row"}):
+        like_btn = event_row.find("span", {"class": "like_btn"})
+        if not like_btn or 'data-like_url' not in like_btn.attrs:
+            continue
+        event_id = int(like_btn['data-like_url'].split('/')[-2])
+
+        game_id = None
+        game_url = None
+        game_thumb_url = None
+        game_cell = event_row.find("div", {"class": "game_cell"})
+        if game_cell and 'data-game_id' in game_cell.attrs:
+            game_id = int(game_cell['data-game_id'])
+            game_link = game_cell.find("a", {"class": "game_link"})
+            if game_link:
+                game_url = game_link.get('href')
+            game_thumb = game_cell.find("img")
+            if game_thumb:
+                game_thumb_url = game_thumb.get('data-lazy_src')
+
+        game_title = None
+        short_summary = event_row.find("div", {"class": "object_short_summary"})
+        game_link = short_summary.find("a") if short_summary else None
+        if not game_id or not game_url:
+            game_id = None
+            game_url = game_link.get('href') if game_link else None
+        if game_link:
+            game_title = game_link.text
+        if not game_url or not game_title:
+            continue
+        events.append((event_id, game_id, game_url, game_title, game_thumb_url))
+    return events
+
+
+def timed(function, content):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        result = function(content)
+    return result, time.perf_counter() - start
+
+
+def main():
+    with open(sys.argv[1] if len(sys.argv) > 1 else FIXTURE_PAGE) as page:
+        content = json.load(page)['content']
+
+    events, elapsed = timed(extract_feed_events, content)
+    soup_events, soup_elapsed = timed(extract_feed_events_soup, content)
+    print(f'lxml: {ITERATIONS / elapsed:.0f} pages/s, {len(events)} events per page')
+    print(f'bs4:  {ITERATIONS / soup_elapsed:.0f} pages/s ({soup_elapsed / elapsed:.1f}x slower)')
+    print(f'results match: {events == soup_events}')
+
+
+if __name__ == '__main__':
+    main()
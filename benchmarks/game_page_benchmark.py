@@ -0,0 +1,99 @@
+"""
+Compare the lxml game page extractor against the previous BeautifulSoup parsing of itch.io game pages.
+
+Usage: python benchmarks/game_page_benchmark.py [saved game page HTML files...]
+
+Without arguments the fixture corpus from tests/fixtures/game_pages is used. Those are small hand-written pages
+covering the extractor's edge cases, so they only check that both paths agree; measure throughput on real pages
+saved with benchmarks/save_game_pages.py. Every page is parsed repeatedly by both paths and their extracted data
+compared.
+"""
+import glob
+import os
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from extractors import extract_game_page  # noqa: E402
+
+FIXTURE_PAGES = os.path.join(ROOT, 'tests', 'fixtures', 'game_pages', '*.html')
+ITERATIONS = 200
+
+
+def extract_game_page_soup(html):
+    """The parsing previously done by Game.parse_game_page"""
+    data = {
+        'status': None,
+        'devlog': None,
+        'rating': None,
+        'rating_count': None,
+        'languages': None,
+        'tags': None,
+        'authors': None,
+        'is_nsfw': False
+    }
+    soup = BeautifulSoup(html, 'html.parser')
+    info_panel = soup.find("div", {"class": "game_info_panel_widget"})
+    if info_panel:
+        game_info = info_panel.find_all("a", href=True)
+        if game_info:
+            data['status'] = game_info[0].text
+    devlog = soup.find("section", id="devlog")
+    if devlog:
+        devlog_links = devlog.find_all('a', href=True)
+        if devlog_links:
+            data['devlog'] = devlog_links[0]['href']
+    rating = soup.find("div", itemprop="ratingValue")
+    rating_count = soup.find("span", itemprop="ratingCount")
+    if rating and rating_count:
+        data['rating'] = rating['content']
+        data['rating_count'] = rating_count['content']
+    info_table = info_panel.find("table") if info_panel else None
+    for tr in info_table.find_all('tr') if info_table else []:
+        tds = tr.find_all('td')
+        if len(tds) < 2:
+            continue
+
+        match tds[0].text:
+            case 'Languages':
+                data['languages'] = tds[1].text.strip()
+            case 'Tags':
+                data['tags'] = tds[1].text.strip()
+            case 'Author' | 'Authors':
+                data['authors'] = ''
+                for author in tds[1].find_all("a", href=True):
+                    if data['authors'] != '':
+                        data['authors'] += ',<br>'
+                    data['authors'] += f'<a href="{author["href"]}" target="_blank">{author.text}</a>'
+    if soup.find("div", {"class": "content_warning_inner"}):
+        data['is_nsfw'] = True
+    return data
+
+
+def timed(function, pages):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        results = [function(page) for page in pages]
+    return results, time.perf_counter() - start
+
+
+def main():
+    pages = []
+    for filename in sys.argv[1:] or sorted(glob.glob(FIXTURE_PAGES)):
+        with open(filename, encoding='utf-8') as page:
+            pages.append(page.read())
+    count = ITERATIONS * len(pages)
+
+    results, elapsed = timed(extract_game_page, pages)
+    soup_results, soup_elapsed = timed(extract_game_page_soup, pages)
+    print(f'lxml: {count / elapsed:.0f} pages/s over {len(pages)} pages')
+    print(f'bs4:  {count / soup_elapsed:.0f} pages/s ({soup_elapsed / elapsed:.1f}x slower)')
+    print(f'results match: {results == soup_results}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Save itch.io game pages for benchmarks/game_page_benchmark.py.
+
+Usage: python benchmarks/save_game_pages.py <output directory> <game page URL>...
+
+Each page is written to <output directory>/<author>_<game>.html as served, going through the same rate limiter
+as the updater. A useful corpus covers adult (content warning), devlog-less, unrated and restricted pages
+without an info panel.
+"""
+import os
+import sys
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from http_client import http_client  # noqa: E402
+from ratelimit import rate_limiter  # noqa: E402
+
+
+def page_filename(url):
+    parsed = urlparse(url)
+    author = parsed.netloc.split('.')[0]
+    game = parsed.path.strip('/').replace('/', '_') or 'index'
+    return f'{author}_{game}.html'
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    directory, urls = sys.argv[1], sys.argv[2:]
+    os.makedirs(directory, exist_ok=True)
+    for url in urls:
+        rate_limiter.acquire(url)
+        response = http_client.request('GET', url, timeout=(3.05, 30))
+        response.raise_for_status()
+        path = os.path.join(directory, page_filename(url))
+        with open(path, 'w', encoding='utf-8') as page:
+            page.write(response.text)
+        print(f'{url} -> {path} ({len(response.content) // 1024} KB)')
+
+
+if __name__ == '__main__':
+    main()
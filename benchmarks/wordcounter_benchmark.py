@@ -0,0 +1,73 @@
+"""
+Compare the pure Python word counter against booting the Ren'Py engine.
+
+Usage: python benchmarks/wordcounter_benchmark.py [extracted game directory]
+
+Without arguments the fixture game from tests/fixtures is scaled up to 500 copies of its main script and only
+the pure Python path is timed. Given an extracted Linux/PC build (with its launcher), both paths are
+timed on a scratch copy of the game and their results compared.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from wordcounter import count_game_directory, run_renpy_wordcounter  # noqa: E402
+
+FIXTURE_GAME = os.path.join(ROOT, 'tests', 'fixtures', 'renpy_game')
+FIXTURE_COPIES = 500
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def script_size(game_directory):
+    return sum(
+        os.path.getsize(os.path.join(directory, filename))
+        for directory, _, files in os.walk(game_directory)
+        for filename in files if filename.endswith('.rpy')
+    )
+
+
+def main():
+    os.chdir(ROOT)
+    with tempfile.TemporaryDirectory() as scratch:
+        game_dir = os.path.join(scratch, 'game_root')
+        if len(sys.argv) > 1:
+            shutil.copytree(sys.argv[1], game_dir, symlinks=True)
+        else:
+            shutil.copytree(FIXTURE_GAME, game_dir)
+            script = os.path.join(game_dir, 'game', 'script.rpy')
+            for copy in range(FIXTURE_COPIES):
+                shutil.copyfile(script, os.path.join(game_dir, 'game', f'script_{copy}.rpy'))
+
+        size = script_size(os.path.join(game_dir, 'game'))
+        stats, elapsed = timed(count_game_directory, os.path.join(game_dir, 'game'))
+        if stats is None:
+            print('Game has compiled-only scripts, the pure Python counter does not apply')
+            return
+        words = sum(language['words'] for language in stats['languages'].values())
+        print(f'python: {elapsed:.3f}s for {size / 1024 ** 2:.1f} MB of script, {words} words '
+              f'({size / 1024 ** 2 / elapsed:.1f} MB/s)')
+
+        launchers = [filename for filename in os.listdir(game_dir) if filename.endswith('.sh')]
+        if not launchers:
+            print('engine: skipped, no launcher in game directory')
+            return
+
+        engine_stats, engine_elapsed = timed(run_renpy_wordcounter, game_dir, os.listdir(game_dir))
+        print(f'engine: {engine_elapsed:.3f}s ({engine_elapsed / elapsed:.0f}x slower)')
+        # Only the pure Python counter reports per-file stats
+        language_stats = {key: value for key, value in stats.items() if key != 'files'}
+        print(f'results match: {engine_stats == language_stats}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Outbound Discord notifications. Every subscriber's messages are one delivery; a few workers send
+deliveries concurrently, keeping the number of requests in flight within Discord's rate limits
+(the Discord client additionally waits out per-route limits). DM channels are opened once and
+cached. A failed delivery is retried on its own with backoff, resuming after the last sent message,
+and a user only counts as notified once all their messages went out.
+"""
+import asyncio
+import os
+
+DELIVERY_CONCURRENCY = int(os.environ.get('DELIVERY_CONCURRENCY', 5))
+DELIVERY_MAX_ATTEMPTS = 3
+DELIVERY_RETRY_DELAY = 5
+
+
+class Delivery:
+    def __init__(self, user_id, discord_id, messages, processed_at, mirror_channel=None):
+        self.user_id = user_id
+        self.discord_id = int(discord_id)
+        self.messages = messages
+        self.processed_at = processed_at  # Recorded for the user once delivered
+        self.mirror_channel = mirror_channel  # Also receives the messages, e.g. the admin's notification channel
+        self.sent = 0
+        self.mirrored = 0
+        self.attempts = 0
+        self.error = None
+
+
+def is_permanent(exception):
+    """Client errors like a user not accepting DMs (403) won't go away by retrying, rate limits (429) will"""
+    status = getattr(exception, 'status', None)
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+class DeliveryQueue:
+    """
+    open_dm(discord_id) returns the DM channel of a user, on_delivered(delivery) records that
+    a user has been notified. Both are coroutine functions.
+    """
+
+    def __init__(self, open_dm, on_delivered, concurrency: int = DELIVERY_CONCURRENCY,
+                 max_attempts: int = DELIVERY_MAX_ATTEMPTS, retry_delay: float = DELIVERY_RETRY_DELAY):
+        self.open_dm = open_dm
+        self.on_delivered = on_delivered
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.dm_channels = {}
+
+    async def deliver(self, deliveries):
+        """Send all deliveries, returns the ones that failed for good"""
+        queue = asyncio.Queue()
+        for delivery in deliveries:
+            queue.put_nowait(delivery)
+        failed = []
+        workers = [
+            asyncio.create_task(self.work(queue, failed))
+            for _ in range(min(self.concurrency, queue.qsize()))
+        ]
+        await queue.join()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        return failed
+
+    async def work(self, queue, failed):
+        while True:
+            delivery = await queue.get()
+            try:
+                await self.attempt(delivery, failed)
+            finally:
+                queue.task_done()
+
+    async def attempt(self, delivery, failed):
+        while True:
+            delivery.attempts += 1
+            try:
+                await self.send(delivery)
+                await self.on_delivered(delivery)
+                return
+            except Exception as exception:
+                delivery.error = exception
+                print(f"\n[DeliveryQueue] Delivery to {delivery.discord_id} failed "
+                      f"(attempt {delivery.attempts}): {exception}\n")
+                # A stale cached channel is opened again on the next attempt
+                self.dm_channels.pop(delivery.discord_id, None)
+                if is_permanent(exception) or delivery.attempts >= self.max_attempts:
+                    failed.append(delivery)
+                    return
+            await asyncio.sleep(self.retry_delay * 2 ** (delivery.attempts - 1))
+
+    async def send(self, delivery):
+        channel = await self.dm_channel(delivery.discord_id)
+        # Messages already sent to either channel by an earlier attempt are skipped there
+        for index, message in enumerate(delivery.messages):
+            if index >= delivery.sent:
+                await channel.send(message)
+                delivery.sent = index + 1
+            if delivery.mirror_channel and index >= delivery.mirrored:
+                await delivery.mirror_channel.send(message)
+                delivery.mirrored = index + 1
+
+    async def dm_channel(self, discord_id):
+        channel = self.dm_channels.get(discord_id)
+        if channel is None:
+            channel = await self.open_dm(discord_id)
+            self.dm_channels[discord_id] = channel
+        return channel
@@ -0,0 +1,122 @@
+"""
+Targeted lxml extractors for the itch.io pages we scrape. Each one parses the document once and
+only evaluates the precompiled XPath expressions it needs, instead of building a BeautifulSoup tree.
+"""
+
+from lxml import etree, html
+
+
+def _has_class(name):
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+
+_EVENT_ROWS = etree.XPath(f'//div[{_has_class("event_row")}]')
+_LIKE_URL = etree.XPath(f'.//span[{_has_class("like_btn")}]/@data-like_url')
+_GAME_CELL = etree.XPath(f'.//div[{_has_class("game_cell")}]')
+_GAME_LINK = etree.XPath(f'.//a[{_has_class("game_link")}]/@href')
+_GAME_THUMB = etree.XPath('.//img/@data-lazy_src')
+_SUMMARY_LINK = etree.XPath(f'.//div[{_has_class("object_short_summary")}]//a')
+
+_INFO_PANEL = etree.XPath(f'//div[{_has_class("game_info_panel_widget")}]')
+_INFO_LINKS = etree.XPath('.//a[@href]')
+_INFO_ROWS = etree.XPath('(.//table)[1]//tr')
+_INFO_CELLS = etree.XPath('.//td')
+_DEVLOG_LINK = etree.XPath('//section[@id="devlog"]//a[@href]/@href')
+_RATING = etree.XPath('//div[@itemprop="ratingValue"]/@content')
+_RATING_COUNT = etree.XPath('//span[@itemprop="ratingCount"]/@content')
+_CONTENT_WARNING = etree.XPath(f'boolean(//div[{_has_class("content_warning_inner")}])')
+
+
+def _first(results):
+    return results[0] if results else None
+
+
+def extract_feed_events(content):
+    """
+    Extract (event_id, game_id, game_url, title, thumb_url) from the HTML content of a my-feed page.
+
+    Rows without a like button (no event ID), game URL or title are skipped. game_id is None when it
+    has to be derived from the game URL, i.e. when there's no game cell with both an ID and a link.
+    """
+    if not content or not content.strip():
+        return []
+
+    events = []
+    for event_row in _EVENT_ROWS(html.fromstring(content)):
+        like_url = _first(_LIKE_URL(event_row))
+        if not like_url:
+            continue
+        event_id = int(like_url.split('/')[-2])
+
+        game_id = None
+        game_url = None
+        thumb_url = None
+
+        game_cell = _first(_GAME_CELL(event_row))
+        if game_cell is not None and game_cell.get('data-game_id'):
+            game_id = int(game_cell.get('data-game_id'))
+            game_url = _first(_GAME_LINK(game_cell))
+            thumb_url = _first(_GAME_THUMB(game_cell))
+
+        summary_link = _first(_SUMMARY_LINK(event_row))
+        if not game_id or not game_url:
+            game_id = None
+            game_url = summary_link.get('href') if summary_link is not None else None
+
+        title = summary_link.text_content() if summary_link is not None else None
+        if not game_url or not title:
+            continue
+
+        events.append((event_id, game_id, game_url, title, thumb_url))
+    return events
+
+
+def extract_game_page(content):
+    """
+    Extract the metadata we keep from an itch.io game page: status, devlog link, rating, rating count,
+    languages, tags, authors (as HTML links) and the NSFW flag. Missing fields are left as None.
+    """
+    data = {
+        'status': None,
+        'devlog': None,
+        'rating': None,
+        'rating_count': None,
+        'languages': None,
+        'tags': None,
+        'authors': None,
+        'is_nsfw': False
+    }
+    if not content or not content.strip():
+        return data
+    document = html.fromstring(content)
+
+    info_panel = _first(_INFO_PANEL(document))
+    if info_panel is not None:
+        info_links = _INFO_LINKS(info_panel)
+        if info_links:
+            data['status'] = info_links[0].text_content()
+
+        for info_row in _INFO_ROWS(info_panel):
+            cells = _INFO_CELLS(info_row)
+            if len(cells) < 2:
+                continue
+
+            match cells[0].text_content():
+                case 'Languages':
+                    data['languages'] = cells[1].text_content().strip()
+                case 'Tags':
+                    data['tags'] = cells[1].text_content().strip()
+                case 'Author' | 'Authors':
+                    data['authors'] = ',<br>'.join(
+                        f'<a href="{author.get("href")}" target="_blank">{author.text_content()}</a>'
+                        for author in _INFO_LINKS(cells[1])
+                    )
+
+    data['devlog'] = _first(_DEVLOG_LINK(document))
+    rating = _first(_RATING(document))
+    rating_count = _first(_RATING_COUNT(document))
+    if rating is not None and rating_count is not None:
+        data['rating'] = rating
+        data['rating_count'] = rating_count
+    data['is_nsfw'] = _CONTENT_WARNING(document)
+    return data
@@ -0,0 +1,128 @@
+import os
+import pickle
+import threading
+
+import requests
+from bs4 import BeautifulSoup
+from requests import RequestException
+from requests.adapters import HTTPAdapter
+from tenacity import retry, wait_exponential
+
+from ratelimit import rate_limiter
+
+COOKIES_FILE = 'itch_cookies.pkl'
+# Connections kept alive per host
+HTTP_POOL_API = int(os.environ.get('HTTP_POOL_API', 4))
+HTTP_POOL_HTML = int(os.environ.get('HTTP_POOL_HTML', 4))
+HTTP_POOL_DEFAULT = int(os.environ.get('HTTP_POOL_DEFAULT', 2))
+
+
+def create_session():
+    """Create a session with keep-alive connection pools sized per host"""
+    session = requests.Session()
+    # Game pages live on <author>.itch.io, so keep pools for a good number of hosts around
+    session.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=HTTP_POOL_DEFAULT))
+    session.mount('https://itch.io', HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_HTML))
+    session.mount('https://api.itch.io', HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_API))
+    return session
+
+
+class HttpClient:
+    """
+    Process wide HTTP sessions for all itch.io traffic: a plain session for API key authenticated
+    requests, pages and downloads, and a cookie session logged in to itch.io for the feed
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.session = create_session()
+        self.login_session = None
+
+    def reset(self):
+        """Drop all pooled connections, e.g. after forking a worker process"""
+        self.lock = threading.Lock()
+        self.session = create_session()
+        self.login_session = None
+
+    def request(self, method, url, itch_api_key=None, **kwargs):
+        """Requests to the itch.io API pass the key, which is sent as the Authorization header"""
+        if itch_api_key:
+            kwargs['headers'] = {**kwargs.get('headers', {}), 'Authorization': itch_api_key}
+        return self.session.request(method, url, **kwargs)
+
+    def cookie_session(self):
+        """Get the session logged in to itch.io, logging in only once across all threads"""
+        with self.lock:
+            if self.login_session is None:
+                self.login_session = self.load_cookie_session() or self.login()
+            return self.login_session
+
+    def invalidate_cookie_session(self):
+        with self.lock:
+            self.login_session = None
+
+    @staticmethod
+    def load_cookie_session():
+        """Try to restore the session from saved cookies"""
+        if not os.path.exists(COOKIES_FILE):
+            return None
+
+        session = create_session()
+        with open(COOKIES_FILE, 'rb') as f:
+            session.cookies.update(pickle.load(f))
+
+        # Verify the session is still valid with a test request
+        try:
+            rate_limiter.acquire('https://itch.io/dashboard')
+            test_response = session.get('https://itch.io/dashboard', timeout=5)
+            if test_response.status_code == 200 and 'login' not in test_response.url:
+                return session
+        except RequestException:
+            pass
+        return None
+
+    @staticmethod
+    @retry(wait=wait_exponential(multiplier=2, min=30, max=120))
+    def login():
+        print("\n[HttpClient] Attempting Login\n")
+
+        ITCH_USER = os.environ['ITCH_USER']
+        ITCH_PASSWORD = os.environ['ITCH_PASSWORD']
+
+        session = create_session()
+
+        # Get CSRF token
+        url = "https://itch.io/login"
+        rate_limiter.acquire(url)
+        login = session.get(url, timeout=5)
+        if login.status_code != 200:
+            raise RequestException("Status code not 200, retrying")
+
+        soup = BeautifulSoup(login.text, "html.parser")
+        csrf_token = soup.find("input", {"name": "csrf_token"})["value"]
+
+        # Login
+        rate_limiter.acquire(url)
+        response = session.post(
+            url,
+            data={
+                "username": ITCH_USER,
+                "password": ITCH_PASSWORD,
+                "csrf_token": csrf_token
+            },
+            timeout=5
+        )
+
+        if response.status_code != 200:
+            raise RequestException("Status code not 200, retrying")
+
+        # Save cookies for future use
+        with open(COOKIES_FILE, 'wb') as f:
+            pickle.dump(session.cookies, f)
+
+        return session
+
+
+http_client = HttpClient()
+# Forked analysis workers must not share pooled sockets with the parent process
+os.register_at_fork(after_in_child=http_client.reset)
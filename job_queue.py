@@ -0,0 +1,290 @@
+"""
+Durable job queue in the queued_jobs table. Workers in any number of threads or processes claim due jobs
+with SELECT ... FOR UPDATE SKIP LOCKED, so each job runs once at a time. A pending job absorbs new jobs with
+its dedupe key; a job enqueued while its twin is running waits for that to finish. Failed jobs are retried
+with exponential backoff; jobs whose worker died or overran their deadline are released again. Periodic
+jobs enqueue their next run when they finish.
+"""
+import datetime
+import os
+import socket
+import threading
+from collections import namedtuple
+
+from sqlalchemy import Column, String, Integer, Text, DateTime, BigInteger, Identity, Index, exists, func, text
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.orm import aliased
+
+from models import Base, Session
+
+JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', 4))
+JOB_POLL_INTERVAL = 5
+JOB_MAX_ATTEMPTS = 5
+JOB_DEADLINE = 15 * 60
+JOB_RETRY_DELAY = 60
+JOB_MAX_RETRY_DELAY = 6 * 60 * 60
+
+# What a worker needs of a claimed job, detached from the session that claimed it
+ClaimedJob = namedtuple('ClaimedJob', ['id', 'kind', 'payload', 'attempts', 'locked_by'])
+
+
+class QueuedJob(Base):
+    __tablename__ = 'queued_jobs'
+    __table_args__ = (
+        Index('ix_queued_jobs_pending_run_at', 'run_at', postgresql_where=text("status = 'pending'")),
+        # At most one pending job per dedupe key, e.g. one refresh per game. A running job doesn't absorb new
+        # ones, it may have done its work before whatever caused them
+        Index(
+            'ix_queued_jobs_pending_dedupe_key', 'dedupe_key', unique=True,
+            postgresql_where=text("status = 'pending'")
+        ),
+        Index('ix_queued_jobs_running_dedupe_key', 'dedupe_key', postgresql_where=text("status = 'running'")),
+    )
+
+    id = Column(BigInteger, Identity(), primary_key=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    kind = Column(String(50), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    dedupe_key = Column(String(100))
+    status = Column(String(20), nullable=False)  # pending, running, done, failed, superseded
+    run_at = Column(DateTime, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    deadline = Column(Integer, nullable=False)  # Seconds a single attempt may take
+    locked_by = Column(String(100))
+    locked_until = Column(DateTime)
+    error = Column(Text)
+
+    def __init__(self, kind, payload=None, dedupe_key=None, run_at=None, max_attempts=JOB_MAX_ATTEMPTS,
+                 deadline=JOB_DEADLINE):
+        self.kind = kind
+        self.payload = payload or {}
+        self.dedupe_key = dedupe_key
+        self.status = 'pending'
+        self.run_at = run_at or datetime.datetime.utcnow()
+        self.attempts = 0
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self.created_at = datetime.datetime.utcnow()
+        self.updated_at = datetime.datetime.utcnow()
+
+
+def enqueue(session, kind, payload=None, dedupe_key=None, run_at=None, max_attempts=JOB_MAX_ATTEMPTS,
+            deadline=JOB_DEADLINE):
+    """
+    Add a job, unless a pending job with the same dedupe key exists already.
+    The caller commits. Returns True if the job was added.
+    """
+    job = QueuedJob(kind, payload, dedupe_key, run_at, max_attempts, deadline)
+    values = {column.name: getattr(job, column.name) for column in QueuedJob.__table__.columns if column.name != 'id'}
+    result = session.execute(
+        insert(QueuedJob)
+        .values(**values)
+        .on_conflict_do_nothing(
+            index_elements=['dedupe_key'],
+            index_where=QueuedJob.status == 'pending'
+        )
+    )
+    return result.rowcount > 0
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt of a job that failed attempts times"""
+    return datetime.timedelta(seconds=min(JOB_RETRY_DELAY * 2 ** (attempts - 1), JOB_MAX_RETRY_DELAY))
+
+
+def next_daily_run(hour, minute=0, now=None):
+    """Next occurrence of a local wall clock time, as naive UTC like the other timestamps"""
+    now = now or datetime.datetime.now().astimezone()
+    run_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if run_at <= now:
+        run_at += datetime.timedelta(days=1)
+    return run_at.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def claim(session, worker_id):
+    """
+    Lock the next due job for worker_id and commit, returns a ClaimedJob or None if there's nothing to do.
+    Jobs whose dedupe key is held by a running job wait until that one is finished.
+    """
+    now = datetime.datetime.utcnow()
+    running = aliased(QueuedJob)
+    job = session.query(QueuedJob) \
+        .filter(
+            QueuedJob.status == 'pending',
+            QueuedJob.run_at <= now,
+            ~exists().where(running.dedupe_key == QueuedJob.dedupe_key, running.status == 'running')
+        ) \
+        .order_by(QueuedJob.run_at, QueuedJob.id) \
+        .with_for_update(skip_locked=True) \
+        .limit(1) \
+        .first()
+    if not job:
+        session.rollback()
+        return None
+
+    job.status = 'running'
+    job.attempts += 1
+    job.locked_by = worker_id
+    job.locked_until = now + datetime.timedelta(seconds=job.deadline)
+    job.updated_at = now
+    claimed = ClaimedJob(job.id, job.kind, job.payload, job.attempts, worker_id)
+    session.commit()
+    return claimed
+
+
+def finish(session, job, error=None):
+    """
+    Record the outcome of a claimed job. A failed job is retried with backoff until it runs out of attempts.
+    Returns the job's new status, or None if the attempt was released in the meantime (deadline exceeded)
+    and its outcome discarded.
+    """
+    current = session.query(QueuedJob) \
+        .filter(
+            QueuedJob.id == job.id,
+            QueuedJob.status == 'running',
+            QueuedJob.locked_by == job.locked_by,
+            QueuedJob.attempts == job.attempts
+        ) \
+        .with_for_update() \
+        .first()
+    if not current:
+        session.rollback()
+        return None
+
+    release(current, error)
+    supersede(session, current)
+    status = current.status
+    session.commit()
+    return status
+
+
+def release(job, error=None):
+    now = datetime.datetime.utcnow()
+    job.locked_by = None
+    job.locked_until = None
+    job.updated_at = now
+    job.error = error
+    if error is None:
+        job.status = 'done'
+    elif job.attempts >= job.max_attempts:
+        job.status = 'failed'
+    else:
+        job.status = 'pending'
+        job.run_at = now + retry_delay(job.attempts)
+
+
+def supersede(session, job):
+    """Drop the retry of a job if a job with its dedupe key was enqueued meanwhile, that one does the same work"""
+    if job.status != 'pending' or job.dedupe_key is None:
+        return
+    duplicate = session.query(QueuedJob.id) \
+        .filter(QueuedJob.dedupe_key == job.dedupe_key, QueuedJob.status == 'pending', QueuedJob.id != job.id) \
+        .first()
+    if duplicate:
+        job.status = 'superseded'
+
+
+def release_expired(session):
+    """Count running jobs past their deadline (e.g. their worker died) as failed attempts, returns them"""
+    expired = session.query(QueuedJob) \
+        .filter(QueuedJob.status == 'running', QueuedJob.locked_until < datetime.datetime.utcnow()) \
+        .with_for_update(skip_locked=True) \
+        .all()
+    for job in expired:
+        print(f"\n[JobWorker] Job {job.id} ({job.kind}) of {job.locked_by} exceeded its deadline\n")
+        release(job, f'Deadline of {job.deadline}s exceeded')
+        supersede(session, job)
+    session.commit()
+    return expired
+
+
+def count_pending(session, kind):
+    """Number of jobs of a kind waiting to run"""
+    return session.query(func.count(QueuedJob.id)) \
+        .filter(QueuedJob.kind == kind, QueuedJob.status == 'pending') \
+        .scalar()
+
+
+def queue_summary(session):
+    """Number of jobs per (kind, status)"""
+    return session.query(QueuedJob.kind, QueuedJob.status, func.count(QueuedJob.id)) \
+        .group_by(QueuedJob.kind, QueuedJob.status) \
+        .order_by(QueuedJob.kind, QueuedJob.status) \
+        .all()
+
+
+class JobWorker:
+    """
+    Runs queued jobs in a number of threads. handlers maps a job kind to a function taking the job's payload;
+    an exception fails the attempt. periodic maps a job kind to a function returning its next run time, the
+    job is enqueued again whenever a run of it ends. deadlines maps periodic job kinds to their deadline in
+    seconds, if it differs from JOB_DEADLINE.
+    """
+
+    def __init__(self, handlers, periodic=None, deadlines=None, threads: int = JOB_WORKER_THREADS,
+                 session_factory=Session):
+        self.handlers = handlers
+        self.periodic = periodic or {}
+        self.deadlines = deadlines or {}
+        self.threads = threads
+        self.session_factory = session_factory
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopped = threading.Event()
+
+    def schedule_periodic(self):
+        """Make sure every periodic job has a pending run"""
+        with self.session_factory() as session:
+            for kind in self.periodic:
+                self.reschedule(session, kind)
+
+    def reschedule(self, session, kind):
+        enqueue(session, kind, dedupe_key=f'periodic:{kind}', run_at=self.periodic[kind](),
+                deadline=self.deadlines.get(kind, JOB_DEADLINE))
+        session.commit()
+
+    def run(self) -> None:
+        self.schedule_periodic()
+        for number in range(self.threads):
+            thread = threading.Thread(target=self.work, args=(f'{self.worker_id}:{number}',), daemon=True)
+            thread.start()
+
+    def run_forever(self) -> None:
+        self.run()
+        self.stopped.wait()
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def work(self, worker_id):
+        print(f"\n[JobWorker] {worker_id} Start\n")
+        while not self.stopped.is_set():
+            try:
+                with self.session_factory() as session:
+                    for expired in release_expired(session):
+                        if expired.status == 'failed' and expired.kind in self.periodic:
+                            self.reschedule(session, expired.kind)
+                    job = claim(session, worker_id)
+                if job:
+                    self.run_job(job)
+            except Exception as exception:
+                print(f"\n[JobWorker] {worker_id} Error: {exception}\n")
+                job = None
+            if not job:
+                self.stopped.wait(JOB_POLL_INTERVAL)
+
+    def run_job(self, job):
+        print(f"\n[JobWorker] Running job {job.id} ({job.kind}), attempt {job.attempts}\n")
+        error = None
+        try:
+            handler = self.handlers[job.kind]
+            handler(job.payload)
+        except Exception as exception:
+            print(f"\n[JobWorker] Job {job.id} ({job.kind}) failed: {exception}\n")
+            error = str(exception) or type(exception).__name__
+
+        with self.session_factory() as session:
+            status = finish(session, job, error)
+            if job.kind in self.periodic and status in ('done', 'failed'):
+                self.reschedule(session, job.kind)
@@ -0,0 +1,97 @@
+"""
+Background jobs for long running admin commands. A job works through its items one at a time on the bot's
+event loop, with the blocking work itself running on the DB executor. Progress goes to a report callback
+(e.g. editing a status message), and jobs can be listed and cancelled while they run.
+"""
+import asyncio
+import itertools
+import time
+
+PROGRESS_INTERVAL = 5
+
+
+class Job:
+    def __init__(self, job_id, description, items):
+        self.id = job_id
+        self.description = description
+        self.items = items
+        self.done = 0
+        self.failed = 0
+        self.status = 'queued'
+        self.cancelled = False
+        self.task = None
+
+    @property
+    def total(self):
+        return len(self.items)
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'cancelled', 'failed')
+
+    def summary(self):
+        failed = f', {self.failed} failed' if self.failed else ''
+        return f'Job #{self.id} {self.description}: {self.status}, {self.done}/{self.total} done{failed}'
+
+
+class JobRunner:
+    def __init__(self, progress_interval: float = PROGRESS_INTERVAL, clock=time.monotonic):
+        self.jobs = {}
+        self.progress_interval = progress_interval
+        self.clock = clock
+        self.ids = itertools.count(1)
+
+    def submit(self, description, items, work, report=None):
+        """
+        Start a job calling the coroutine function work(item) for every item. work returns an error message
+        for a failed item, or None. report(job) is awaited on start, every progress_interval seconds and when
+        the job ends.
+        """
+        job = Job(next(self.ids), description, list(items))
+        self.jobs[job.id] = job
+        job.task = asyncio.get_running_loop().create_task(self.run(job, work, report))
+        return job
+
+    async def run(self, job, work, report):
+        job.status = 'running'
+        await self.report(job, report)
+        last_report = self.clock()
+        try:
+            for item in job.items:
+                if job.cancelled:
+                    job.status = 'cancelled'
+                    break
+                if await work(item):
+                    job.failed += 1
+                job.done += 1
+                if self.clock() - last_report >= self.progress_interval:
+                    await self.report(job, report)
+                    last_report = self.clock()
+            else:
+                job.status = 'done'
+        except Exception as exception:
+            print(f"\n[Job Error] {job.summary()}: {exception}\n")
+            job.status = 'failed'
+        await self.report(job, report)
+
+    @staticmethod
+    async def report(job, report):
+        if not report:
+            return
+        try:
+            await report(job)
+        except Exception as exception:
+            # Progress reporting must never stop the job itself
+            print(f"\n[Job Report Error] {job.summary()}: {exception}\n")
+
+    def cancel(self, job_id):
+        """Stop a job after the item it's currently working on, returns False if there's no such running job"""
+        job = self.jobs.get(job_id)
+        if not job or job.is_finished:
+            return False
+        job.cancelled = True
+        return True
+
+    def list_jobs(self):
+        """All jobs, newest first. Finished jobs are kept until the bot restarts"""
+        return sorted(self.jobs.values(), key=lambda job: job.id, reverse=True)
@@ -1,11 +1,17 @@
 # This bot requires the 'message_content' privileged intent to function.
+import asyncio
 import datetime
 import os
-import time
 
+import discord
 from discord.ext import commands, tasks
-from models import engine, Session, Base, Game, User, GameVersion
+from delivery import Delivery, DeliveryQueue
+from models import engine, Base, SEARCH_LIMIT
+from ratelimit import rate_limiter
+from jobs import JobRunner
+from repository import BotRepository
 from scheduler import Scheduler
+from version_listener import VersionListener
 
 DISCORD_API_KEY = os.environ['DISCORD_API_KEY']
 DISCORD_ADMIN_ID = os.environ['DISCORD_ADMIN_ID']
@@ -18,7 +24,11 @@ Base.metadata.create_all(engine)
 scheduler = Scheduler()
 scheduler.run(ITCH_API_KEY, ITCH_COLLECTION_ID)
 
+repository = BotRepository()
+job_runner = JobRunner()
 bot = commands.Bot()
+# Serializes pushed and polled notifier runs, so nobody is notified twice
+notify_lock = asyncio.Lock()
 
 
 @bot.event
@@ -26,151 +36,162 @@ async def on_ready():
     print('Bot is ready')
     if not notify_about_updates.is_running():
         notify_about_updates.start()
+        await version_listener.start()
 
 
+# New versions are pushed by the version listener, which also catches up after reconnecting.
+# The poll is a fallback for when the listener's connection is down.
 @tasks.loop(minutes=30)
 async def notify_about_updates():
-    print("\n[notify_about_updates] Start\n")
     await bot.wait_until_ready()
-    with Session() as session:
-        users = session.query(User)
-        print("\n[notify_about_updates] User loop\n")
-        for user in users:
-            start_time = datetime.datetime.utcnow()
-            game_versions = session.query(
-                Game, GameVersion
-            ).join(
-                Game, GameVersion.game_id == Game.id
-            ).filter(
-                Game.is_visible == True,
-                GameVersion.created_at > user.processed_at,
-                GameVersion.is_latest == True
-            ).order_by(
-                Game.name
-            ).all()
-            if game_versions:
-                discord_user = bot.get_user(user.discord_id) or await bot.fetch_user(user.discord_id)
-                if int(user.discord_id) == int(DISCORD_ADMIN_ID):
-                    print("\n[notify_about_updates] Is admin user\n")
+    await send_notifications()
+
+
+async def send_notifications():
+    async with notify_lock:
+        print("\n[notify_about_updates] Start\n")
+        users, feed, start_time = await repository.notification_feed()
+        deliveries = []
+        for user_id, discord_id, processed_at in users:
+            messages = feed.messages_since(processed_at)
+            if messages:
+                if int(discord_id) == int(DISCORD_ADMIN_ID):
                     discord_channel = bot.get_channel(int(DISCORD_NOTIFICATIONS_CHANNEL_ID)) \
                         or await bot.fetch_channel(int(DISCORD_NOTIFICATIONS_CHANNEL_ID))
                 else:
                     discord_channel = None
-                result = f'Found {len(game_versions)} new updates:\n'
-                for game, game_version in game_versions:
-                    result += f'{game.name}, Latest Version: {game_version.version}, ' \
-                              f'Last Updated At: <t:{int(datetime.datetime.timestamp(game_version.published_at))}:f> <{game.url}> | <{game_version.devlog}>\n'
-                    if len(result) > 1600:
-                        await discord_user.send(result)
-                        if discord_channel:
-                            await discord_channel.send(result)
-                        result = ''
-                if result:
-                    await discord_user.send(result)
-                    if discord_channel:
-                        await discord_channel.send(result)
-                user.processed_at = start_time
-                session.commit()
+                deliveries.append(Delivery(user_id, discord_id, messages, start_time, discord_channel))
+        print(f"\n[notify_about_updates] Delivering to {len(deliveries)} users\n")
+        failed = await delivery_queue.deliver(deliveries)
+        if failed:
+            print(f"\n[notify_about_updates] {len(failed)} deliveries failed, retrying on the next run\n")
+
+
+async def open_dm(discord_id):
+    # Opens the DM channel directly, without fetching the user first
+    return await bot.create_dm(discord.Object(id=discord_id))
+
+
+async def mark_delivered(delivery):
+    await repository.mark_notified(delivery.user_id, delivery.processed_at)
+
+
+delivery_queue = DeliveryQueue(open_dm, mark_delivered)
+version_listener = VersionListener(send_notifications)
 
 
 @bot.slash_command(name="subscribe")
 async def subscribe(ctx):
-    with Session() as session:
-        user = session.query(User) \
-            .filter(User.discord_id == ctx.author.id) \
-            .first()
-        if not user:
-            # Start user off from point of subscription
-            user = User(discord_id=ctx.author.id, processed_at=int(time.time()))
-            session.add(user)
-            session.commit()
-            await ctx.respond('You\'ve subscribed to receive update infos.')
-        else:
-            await ctx.respond('You\'ve already subscribed to receive update infos.')
+    if await repository.subscribe(ctx.author.id):
+        await ctx.respond('You\'ve subscribed to receive update infos.')
+    else:
+        await ctx.respond('You\'ve already subscribed to receive update infos.')
 
 
 @bot.slash_command(name="unsubscribe")
 async def unsubscribe(ctx):
-    with Session() as session:
-        user = session.query(User) \
-            .filter(User.discord_id == ctx.author.id) \
-            .first()
-        if user:
-            session.delete(user)
-            session.commit()
-            await ctx.respond('You\'ve unsubscribed from update infos.')
-        else:
-            await ctx.respond('You\'re not currently subscribed.')
+    if await repository.unsubscribe(ctx.author.id):
+        await ctx.respond('You\'ve unsubscribed from update infos.')
+    else:
+        await ctx.respond('You\'re not currently subscribed.')
+
+
+def is_admin(ctx):
+    return int(ctx.author.id) == int(DISCORD_ADMIN_ID)
 
 
 @bot.slash_command(name="refresh")
 async def refresh(ctx, name, refresh_version: bool = True, refresh_base_info: bool = False, refresh_tags: bool = False, force: bool = False):
-    if int(ctx.author.id) != int(DISCORD_ADMIN_ID):
+    if not is_admin(ctx):
         await ctx.respond('You\'re not authorized to use this command')
         return
 
     if name:
-        with Session() as session:
-            if force:
-                games = session.query(Game) \
-                    .filter(Game.is_visible == True, Game.name.contains(name)) \
-                    .all()
-            else:
-                games = session.query(Game) \
-                    .filter(Game.is_visible == True, Game.status != 'Abandoned', Game.status != 'Canceled', Game.name.contains(name)) \
-                    .all()
-            matches = len(games)
-            if matches:
-                await ctx.respond(f'Refreshing {matches} matches for "{name}"')
-                for game in games:
-                    try:
-                        game.error = None
-                        if refresh_base_info:
-                            game.refresh_base_info(ITCH_API_KEY)
-                            session.commit()
-                            time.sleep(10)
-                        if refresh_tags:
-                            game.refresh_tags_and_rating()
-                            session.commit()
-                            time.sleep(10)
-                        if refresh_version:
-                            game.refresh_version(ITCH_API_KEY, force)
-                            session.commit()
-                            time.sleep(10)
-                    except Exception as exception:
-                        print("\n[Update Error] ", exception, "\n")
-                        game.error = exception
-                        session.commit()
-            else:
-                await ctx.respond(f'Found no matches for "{name}"')
+        game_ids = await repository.find_refreshable_games(name, force)
+        matches = len(game_ids)
+        if matches:
+            status_message = None
+
+            async def refresh_game(game_id):
+                return await repository.refresh_game(
+                    game_id, ITCH_API_KEY, refresh_version, refresh_base_info, refresh_tags, force
+                )
+
+            async def report(job):
+                # Interaction tokens expire, so progress goes to a regular channel message
+                nonlocal status_message
+                if status_message:
+                    await status_message.edit(content=job.summary())
+                elif ctx.channel:
+                    status_message = await ctx.channel.send(job.summary())
+
+            job = job_runner.submit(f'refreshing {matches} matches for "{name}"', game_ids, refresh_game, report)
+            await ctx.respond(f'Started job #{job.id}, refreshing {matches} matches for "{name}"')
+        else:
+            await ctx.respond(f'Found no matches for "{name}"')
     else:
         await ctx.respond('Usage: <command> <search term>')
 
 
+@bot.slash_command(name="jobs")
+async def jobs(ctx):
+    if not is_admin(ctx):
+        await ctx.respond('You\'re not authorized to use this command')
+        return
+
+    job_list = job_runner.list_jobs()
+    if job_list:
+        await ctx.respond('\n'.join(job.summary() for job in job_list[:20]))
+    else:
+        await ctx.respond('No jobs have been started.')
+
+
+@bot.slash_command(name="queue")
+async def queue(ctx):
+    if not is_admin(ctx):
+        await ctx.respond('You\'re not authorized to use this command')
+        return
+
+    summary = await repository.queue_summary()
+    lines = [f'{kind}: {count} {status}' for kind, status, count in summary] or ['The job queue is empty.']
+    for kind, status, count in summary:
+        if kind == 'refresh_game_version' and status == 'pending':
+            drain_time = datetime.timedelta(seconds=round(rate_limiter.drain_time('api', count)))
+            lines.append(f'Expected drain time of pending version refreshes: {drain_time}')
+    for kind, total, due in await repository.refresh_savings():
+        lines.append(f'{kind} (last 7 days): checked {due} of {total} games, saved {total - due} requests')
+    await ctx.respond('\n'.join(lines))
+
+
+@bot.slash_command(name="cancel")
+async def cancel(ctx, job_id: int):
+    if not is_admin(ctx):
+        await ctx.respond('You\'re not authorized to use this command')
+        return
+
+    if job_runner.cancel(job_id):
+        await ctx.respond(f'Cancelling job #{job_id} after its current game.')
+    else:
+        await ctx.respond(f'Job #{job_id} is not running.')
+
+
 @bot.slash_command(name="search")
 async def search(ctx, name):
     if name:
         await ctx.defer()
-        with Session() as session:
-            games = session.query(Game, GameVersion) \
-                .join(GameVersion, GameVersion.game_id == Game.id) \
-                .filter(
-                    Game.is_visible == True,
-                    Game.name.contains(name),
-                    GameVersion.is_latest == True
-                ) \
-                .all()
-            matches = len(games)
-            if matches:
-                result = f'Found {matches} matches for "{name}":\n'
-                for game, version in games:
-                    if len(result) > 1600:
-                        await ctx.send(result.strip())
-                        result = ''
-                    result += f'{game.name}, Latest Version: {version.version}, ' \
-                              f'Last Updated At: <t:{int(datetime.datetime.timestamp(version.published_at))}:f> <{game.url}>\n'
-            else:
-                result = f'Found no matches for "{name}"'
+        games = await repository.search(name)
+        matches = len(games)
+        if matches:
+            more = ' (showing the best matches only)' if matches >= SEARCH_LIMIT else ''
+            result = f'Found {matches} matches for "{name}"{more}:\n'
+            for game, version in games:
+                if len(result) > 1600:
+                    await ctx.send(result.strip())
+                    result = ''
+                result += f'{game.name}, Latest Version: {version.version}, ' \
+                          f'Last Updated At: <t:{int(datetime.datetime.timestamp(version.published_at))}:f> <{game.url}>\n'
+        else:
+            result = f'Found no matches for "{name}"'
     else:
         result = 'Usage: <command> <search term>'
     await ctx.followup.send(result.strip())
@@ -1,27 +1,28 @@
 # coding=utf-8
 
 import datetime
+import hashlib
 import json
 import os
-import pickle
 import re
-import subprocess
 import zipfile
 import tarfile
 import shutil
-import time
 
 import requests
 from requests import RequestException
 from sqlalchemy import create_engine, Column, String, Integer, Float, Text, BOOLEAN, ForeignKey, DateTime, BigInteger, \
-    Identity, func, or_
-from sqlalchemy.dialects.postgresql import JSONB
+    DDL, Identity, Index, event, func, literal, literal_column, or_, text
+from sqlalchemy.dialects.postgresql import JSONB, insert
 from sqlalchemy_json import mutable_json_type
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
-from bs4 import BeautifulSoup
-from shlex import quote
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship, object_session
 from tenacity import *
 
+from extractors import extract_game_page
+from http_client import http_client
+from ratelimit import rate_limiter
+from wordcounter import count_game_directory, run_renpy_wordcounter
+
 engine = create_engine(
     f'postgresql+psycopg2://{os.environ["DB_USER"]}:{os.environ["DB_PASSWORD"]}@db/{os.environ["DB"]}?client_encoding=utf8',
     pool_pre_ping=True,
@@ -31,8 +32,18 @@ engine = create_engine(
 Session = sessionmaker(bind=engine)
 
 Base = declarative_base()
-request_session = None
-COOKIES_FILE = 'itch_cookies.pkl'
+# The trigram search index needs the extension before create_all builds the games table
+event.listen(Base.metadata, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+MAX_DOWNLOAD_SIZE = int(os.environ.get('MAX_DOWNLOAD_SIZE', 6 * 1024 ** 3))
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# 'selective' only unpacks what the word counter needs, 'full' unpacks the whole archive
+EXTRACT_MODE = os.environ.get('EXTRACT_MODE', 'selective')
+SCRIPT_EXTENSIONS = ('.rpy', '.rpyc', '.rpym', '.rpymc', '.rpa', '.py')
+SEARCH_LIMIT = int(os.environ.get('SEARCH_LIMIT', 25))
+# Searched text of a game, must match the expression of ix_games_search_trgm to use the index
+SEARCH_DOCUMENT = "lower(coalesce(games.name, '') || ' ' || coalesce(games.authors, '') || ' ' || coalesce(games.tags, ''))"
+# NOTIFY channel of newly recorded versions, see version_listener.py
+VERSION_CHANNEL = 'game_versions'
 
 def process_language_stats(session, game_version_id, language_code, language_data, game_id):
     """Process language statistics for a given version and language"""
@@ -61,6 +72,237 @@ def process_language_stats(session, game_version_id, language_code, language_dat
         session.add(char_stats)
 
 
+def script_stats_cache_key(upload):
+    """Build the content address of an upload from its md5 hash, falling back to its build ID"""
+    if upload.get('md5_hash'):
+        return f"md5:{upload['md5_hash']}"
+    if upload.get('build_id'):
+        return f"build:{upload['build_id']}"
+    return None
+
+
+def get_cached_script_stats(session, upload):
+    """Return previously computed script stats for identical upload contents, if any"""
+    cache_key = script_stats_cache_key(upload)
+    if not cache_key:
+        return None
+
+    cached = session.query(ScriptStatsCache) \
+        .filter(ScriptStatsCache.cache_key == cache_key) \
+        .first()
+    if not cached:
+        return None
+
+    print(f"\n[get_cached_script_stats] Cache hit for {cache_key}\n")
+    return {'languages': cached.languages}
+
+
+def cache_script_stats(session, upload, stats):
+    """Store script stats under the upload's content address"""
+    cache_key = script_stats_cache_key(upload)
+    if not cache_key or not stats or not stats.get('languages'):
+        return
+
+    cached = session.query(ScriptStatsCache) \
+        .filter(ScriptStatsCache.cache_key == cache_key) \
+        .first()
+    if cached:
+        cached.languages = stats['languages']
+        cached.updated_at = datetime.datetime.utcnow()
+    else:
+        session.add(ScriptStatsCache(cache_key=cache_key, languages=stats['languages']))
+
+
+def store_version_stats(session, game, game_version_id, stats):
+    """Store the script stats of a game version for each language"""
+    if stats and 'languages' in stats:
+        for lang_key, lang_data in stats['languages'].items():
+            if lang_key == 'default' and game.source_language_id:
+                iso_code = game.source_language_id
+            else:
+                iso_code = map_language_code(session, lang_key)
+            process_language_stats(session, game_version_id, iso_code, lang_data, game.id)
+    else:
+        version_stats = VersionLanguageStats(
+            game_version_id=game_version_id,
+            iso_code='eng'
+        )
+        session.add(version_stats)
+
+
+def store_file_stats(session, game_version_id, files):
+    """Store the per-file word counter results of a game version"""
+    for filename, file_data in files.items():
+        session.add(VersionFileStats(
+            game_version_id=game_version_id,
+            filename=filename,
+            content_hash=file_data['hash'],
+            stats=file_data['stats']
+        ))
+
+
+def get_previous_file_stats(session, game_id, game_version_id):
+    """Load the per-file stats of the most recent earlier version of a game that has them"""
+    previous_version_id = session.query(VersionFileStats.game_version_id) \
+        .join(GameVersion, VersionFileStats.game_version_id == GameVersion.id) \
+        .filter(GameVersion.game_id == game_id, GameVersion.id < game_version_id) \
+        .order_by(GameVersion.id.desc()) \
+        .limit(1) \
+        .scalar()
+    if not previous_version_id:
+        return {}
+
+    file_stats = session.query(VersionFileStats) \
+        .filter(VersionFileStats.game_version_id == previous_version_id) \
+        .all()
+    return {row.filename: {'hash': row.content_hash, 'stats': row.stats} for row in file_stats}
+
+
+def get_page_validator(session, url):
+    """Get the cached validators of a page from an earlier visit"""
+    return session.query(PageValidator) \
+        .filter(PageValidator.url == url) \
+        .first()
+
+
+def sync_collection_games(session, collection_games):
+    """
+    Apply one page of an itch.io collection to the games table with a single IN lookup for all of its
+    game IDs; the caller commits once. Returns the games that are new or were hidden and still need their
+    full details loaded.
+    """
+    entries = {entry['game']['id']: entry['game'] for entry in collection_games}
+    if not entries:
+        return []
+    games = {
+        game.game_id: game
+        for game in session.query(Game).filter(Game.game_id.in_(list(entries))).all()
+    }
+
+    needs_details = []
+    for game_id, entry in entries.items():
+        game = games.get(game_id)
+
+        # Update if already in DB
+        if game:
+            if not game.is_visible:
+                game.updated_at = datetime.datetime.utcnow()
+                if not game.source_language_id:
+                    game.source_language_id = 'eng'
+                needs_details.append(game)
+            if entry.get('title') != game.name \
+                    or entry.get('short_text') != game.description \
+                    or entry.get('cover_url') != game.thumb_url:
+                game.name = entry.get('title')
+                game.description = entry.get('short_text')
+                game.thumb_url = entry.get('cover_url')
+                game.updated_at = datetime.datetime.utcnow()
+            if game.initially_published_at is None:
+                game.initially_published_at = datetime.datetime.fromisoformat(entry['published_at'])
+                game.updated_at = datetime.datetime.utcnow()
+        else:
+            game = Game(
+                initially_published_at=datetime.datetime.fromisoformat(entry['published_at']),
+                game_id=game_id,
+                name=entry['title'],
+                description=entry.get('short_text'),
+                url=entry['url'],
+                thumb_url=entry.get('cover_url'),
+                source_language_id='eng'
+            )
+            session.add(game)
+            needs_details.append(game)
+        game.is_visible = True
+    return needs_details
+
+
+def search_games(session, term, limit=SEARCH_LIMIT):
+    """
+    Find visible games and their latest version by name, authors or tags. Matching is typo tolerant
+    (pg_trgm word similarity) and the best matches come first.
+    """
+    term = term.strip().lower()
+    document = literal_column(SEARCH_DOCUMENT)
+    similarity = func.word_similarity(term, document)
+    return session.query(Game, GameVersion) \
+        .join(LatestGameVersion, LatestGameVersion.game_id == Game.id) \
+        .join(GameVersion, GameVersion.id == LatestGameVersion.game_version_id) \
+        .filter(
+            Game.is_visible == True,
+            literal(term).op('<%')(document)
+        ) \
+        .order_by(similarity.desc(), Game.name) \
+        .limit(limit) \
+        .all()
+
+
+def refresh_savings(session, days=7):
+    """(kind, games, due) summed over the refresh runs of the last days; games - due requests were saved"""
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    return session.query(RefreshRun.kind, func.sum(RefreshRun.total), func.sum(RefreshRun.due)) \
+        .filter(RefreshRun.created_at >= since) \
+        .group_by(RefreshRun.kind) \
+        .order_by(RefreshRun.kind) \
+        .all()
+
+
+def find_latest_version(session, game_id, version):
+    """The latest version of a game, if it is the given version"""
+    return session.query(GameVersion) \
+        .join(LatestGameVersion, LatestGameVersion.game_version_id == GameVersion.id) \
+        .filter(LatestGameVersion.game_id == game_id) \
+        .filter(GameVersion.version == version) \
+        .first()
+
+
+def set_latest_version(session, game_version):
+    """
+    Make a just inserted version its game's latest, in the caller's transaction: point the
+    latest_game_version row at it, move the is_latest flag over from the previous version and
+    notify the bot
+    """
+    session.execute(
+        insert(LatestGameVersion)
+        .values(game_id=game_version.game_id, game_version_id=game_version.id, created_at=game_version.created_at)
+        .on_conflict_do_update(
+            index_elements=['game_id'],
+            set_={'game_version_id': game_version.id, 'created_at': game_version.created_at}
+        )
+    )
+    session.query(GameVersion) \
+        .filter(GameVersion.game_id == game_version.game_id, GameVersion.is_latest == True,
+                GameVersion.id != game_version.id) \
+        .update({GameVersion.is_latest: False}, synchronize_session=False)
+    game_version.is_latest = True
+    # Delivered to listeners once the transaction commits
+    session.execute(text('SELECT pg_notify(:channel, :payload)'),
+                    {'channel': VERSION_CHANNEL, 'payload': str(game_version.id)})
+
+
+# Most recently recorded version of every game, used to rebuild latest_game_version and is_latest
+BACKFILL_LATEST_VERSIONS = [
+    """
+    INSERT INTO latest_game_version (game_id, game_version_id, created_at)
+    SELECT DISTINCT ON (game_id) game_id, id, created_at
+    FROM game_versions
+    ORDER BY game_id, id DESC
+    ON CONFLICT (game_id) DO UPDATE
+    SET game_version_id = excluded.game_version_id, created_at = excluded.created_at
+    """,
+    """
+    UPDATE game_versions
+    SET is_latest = (id IN (SELECT game_version_id FROM latest_game_version))
+    WHERE is_latest <> (id IN (SELECT game_version_id FROM latest_game_version))
+    """,
+]
+
+
+def backfill_latest_versions(session):
+    """Rebuild latest_game_version and the is_latest flags from the whole version history"""
+    for statement in BACKFILL_LATEST_VERSIONS:
+        session.execute(text(statement))
+
+
 def generate_placeholder_iso_code(session):
     """Generate a new placeholder ISO code in the qaa-qtz range"""
     # Get the highest placeholder code we've used so far
@@ -139,32 +381,128 @@ def make_request(request_type, url, **kwargs):
     Make an HTTP request with retry functionality
     """
     print(f"[make_request] URL requested: {url}")
-    time.sleep(10)  # Keep the rate limiting
-    response = requests.request(request_type, url, timeout=(3.05, 30), **kwargs)
+    rate_limiter.acquire(url)
+    response = http_client.request(request_type, url, timeout=(3.05, 30), **kwargs)
 
     if response.status_code != requests.codes.ok:
         print(f"\n[make_request] Status != 200: {response.status_code}\n")
 
-    if response.status_code not in [200, 400, 404]:
-        raise RequestException("Status code not 200, 400 or 404, retrying")
+    if response.status_code not in [200, 304, 400, 404]:
+        raise RequestException("Status code not 200, 304, 400 or 404, retrying")
 
     return response
 
 
+def download_file(url, download_path, expected_md5=None, max_size=MAX_DOWNLOAD_SIZE):
+    """
+    Stream a download to disk in chunks, enforcing a size cap and verifying the md5 hash on the way
+    """
+    md5 = hashlib.md5()
+    size = 0
+    with make_request("get", url, allow_redirects=True, stream=True) as response:
+        if response.status_code == 400 or response.status_code == 404:
+            return False
+
+        content_length = int(response.headers.get('Content-Length') or 0)
+        if content_length > max_size:
+            raise RequestException(f"Download size {content_length} exceeds limit of {max_size} bytes")
+
+        with open(download_path, 'wb') as output:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise RequestException(f"Download exceeded limit of {max_size} bytes")
+                md5.update(chunk)
+                output.write(chunk)
+
+    if expected_md5 and md5.hexdigest() != expected_md5:
+        raise RequestException(f"MD5 mismatch, expected {expected_md5}, got {md5.hexdigest()}")
+
+    return True
+
+
+def select_script_members(names):
+    """
+    Select the archive members needed to run the Ren'Py word counter: the launcher at the game root,
+    the engine (renpy/, lib/) and the script files under game/
+    """
+    split_names = []
+    for name in names:
+        parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.')]
+        if parts:
+            split_names.append((name, parts))
+    roots = {parts[0] for _, parts in split_names}
+
+    # Most archives wrap everything in a single top level directory, e.g. MyGame-1.0-pc/
+    prefix_length = 0
+    if len(roots) == 1 and not roots & {'game', 'renpy', 'lib'} and any(len(parts) > 1 for _, parts in split_names):
+        prefix_length = 1
+
+    selected = set()
+    for name, parts in split_names:
+        relative = parts[prefix_length:]
+        if not relative:
+            continue
+        if len(relative) == 1:
+            if relative[0].endswith(('.sh', '.py')):
+                selected.add(name)
+        elif relative[0] in ('renpy', 'lib'):
+            selected.add(name)
+        elif relative[0] == 'game' and relative[-1].lower().endswith(SCRIPT_EXTENSIONS):
+            selected.add(name)
+    return selected
+
+
+def extract_archive(download_path, extract_directory):
+    """
+    Extract a zip or tar archive, returning the (possibly renamed) archive path
+    """
+    if download_path.endswith('.zip'):
+        try:
+            with zipfile.ZipFile(download_path, 'r') as zip_ref:
+                members = None
+                if EXTRACT_MODE == 'selective':
+                    members = select_script_members(zip_ref.namelist())
+                zip_ref.extractall(extract_directory, members=members)
+            return download_path
+        except (zipfile.BadZipfile, IOError, EOFError):
+            base = os.path.splitext(download_path)[0]
+            os.rename(download_path, base + '.tar.bz2')
+            download_path = base + '.tar.bz2'
+
+    if download_path.endswith('.tar.gz'):
+        mode = 'r'
+    elif download_path.endswith('.tar.bz2'):
+        mode = 'r:bz2'
+    else:
+        return download_path
+
+    with tarfile.open(download_path, mode) as tar:
+        members = None
+        if EXTRACT_MODE == 'selective':
+            selected = select_script_members(tar.getnames())
+            members = [member for member in tar.getmembers() if member.name in selected]
+        tar.extractall(extract_directory, members=members)
+    return download_path
+
+
 class Game(Base):
     __tablename__ = 'games'
+    __table_args__ = (
+        Index('ix_games_search_trgm', text(f'({SEARCH_DOCUMENT}) gin_trgm_ops'), postgresql_using='gin'),
+    )
 
     id = Column(BigInteger, (Identity()), primary_key=True)
     created_at = Column(DateTime)
     updated_at = Column(DateTime)
     initially_published_at = Column(DateTime)
-    game_id = Column(Integer, nullable=False)
+    game_id = Column(Integer, nullable=False, index=True)
     name = Column(String(200), nullable=False)
     status = Column(String(50))
     is_visible = Column(BOOLEAN, default=False)
     is_nsfw = Column(BOOLEAN, default=False)
     description = Column(String(200))
-    url = Column(String(250), nullable=False)
+    url = Column(String(250), nullable=False, index=True)  # Identifies feed events without a game cell
     thumb_url = Column(String(250))
     tags = Column(String(250))
     game_engine = Column(String(50))
@@ -177,6 +515,9 @@ class Game(Base):
     source_language_id = Column(String(3), ForeignKey('iso_639_3_languages.id'))
     source_language = relationship("Language", foreign_keys=[source_language_id])
     ratings = relationship("Rating", back_populates="game")
+    # When the nightly jobs should next fetch the game's page and uploads, see refresh_policy
+    next_page_check_at = Column(DateTime, index=True)
+    next_version_check_at = Column(DateTime, index=True)
 
     def __init__(self, created_at=None, updated_at=None, initially_published_at=None, game_id=None, name=None,
                  status='In development', is_visible=False, is_nsfw=False, description=None, url=None, thumb_url=None,
@@ -207,11 +548,9 @@ class Game(Base):
         try:
             # First get base info
             self.refresh_base_info(itch_api_key)
-            time.sleep(10)  # Respect rate limits
 
             # Then get tags and ratings
             self.refresh_tags_and_rating()
-            time.sleep(10)  # Respect rate limits
 
             # Finally get version info
             self.refresh_version(itch_api_key)
@@ -226,53 +565,65 @@ class Game(Base):
 
     def refresh_tags_and_rating(self):
         print("\n[refresh_tags_and_rating] URL: " + self.url + "\n")
-        with make_request("get", self.url, allow_redirects=True) as response:
-            if response.status_code == 400 or response.status_code == 404:
-                return
-            html = response.text
-            soup = BeautifulSoup(html, 'html.parser')
-            if self.status not in ['Abandoned', 'Canceled', 'Released']:
-                game_info = soup.find("div", {"class": "game_info_panel_widget"}).find_all("a", href=True)
-                if game_info:
-                    self.status = game_info[0].text
-            devlog = soup.find("section", id="devlog")
-            if devlog:
-                devlog_links = devlog.find_all('a', href=True)
-                if devlog_links:
-                    devlog_link = devlog_links[0]['href']
-                    self.devlog = devlog_link
-            rating = soup.find("div", itemprop="ratingValue")
-            rating_count = soup.find("span", itemprop="ratingCount")
-            if rating and rating_count:
-                self.rating = rating['content']
-                self.rating_count = rating_count['content']
-            info_table = soup.find("div", {"class": "game_info_panel_widget"}).find("table")
-            for tr in info_table.findAll('tr'):
-                tds = tr.findAll('td')
-                if len(tds) < 2:
-                    continue
-
-                match tds[0].text:
-                    case 'Languages':
-                        self.languages = tds[1].text.strip()
-                    case 'Tags':
-                        self.tags = tds[1].text.strip()
-                    case 'Author' | 'Authors':
-                        self.authors = ''
-                        for author in tds[1].findAll("a", href=True):
-                            if self.authors != '':
-                                self.authors += ',<br>'
-                            self.authors += f'<a href="{author["href"]}" target="_blank">{author.text}</a>'
-            nsfw = soup.find("div", {"class": "content_warning_inner"})
-            if nsfw:
-                self.is_nsfw = True
-            else:
-                self.is_nsfw = False
+        session = object_session(self)
+        validator = get_page_validator(session, self.url) if session else None
+        etag, last_modified = (validator.etag, validator.last_modified) if validator else (None, None)
+        with Game.fetch_game_page(self.url, etag, last_modified) as response:
+            self.update_from_game_page(response, validator)
+
+    @staticmethod
+    def fetch_game_page(url, etag=None, last_modified=None):
+        """Fetch the itch.io page of a game, conditionally if validators from an earlier visit are known"""
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return make_request("get", url, headers=headers, allow_redirects=True)
+
+    def update_from_game_page(self, response, validator=None):
+        """Update status, devlog link, rating, languages, tags, authors and NSFW flag from the game page"""
+        if response.status_code == 400 or response.status_code == 404:
+            return
+
+        if validator and validator.matches(response):
+            # Page unchanged since the last visit, skip parsing and reuse what was extracted then
+            self.apply_game_page_data(validator.data)
+            return
+
+        data = Game.parse_game_page(response.text)
+        self.apply_game_page_data(data)
+
+        if validator:
+            validator.update(response, data)
+        elif object_session(self):
+            object_session(self).add(PageValidator.from_response(self.url, response, data))
+
+    @staticmethod
+    def parse_game_page(html):
+        """Extract the game's metadata from its itch.io page"""
+        return extract_game_page(html)
+
+    def apply_game_page_data(self, data):
+        if self.status not in ['Abandoned', 'Canceled', 'Released'] and data['status']:
+            self.status = data['status']
+        if data['devlog']:
+            self.devlog = data['devlog']
+        if data['rating'] is not None and data['rating_count'] is not None:
+            self.rating = data['rating']
+            self.rating_count = data['rating_count']
+        if data['languages'] is not None:
+            self.languages = data['languages']
+        if data['tags'] is not None:
+            self.tags = data['tags']
+        if data['authors'] is not None:
+            self.authors = data['authors']
+        self.is_nsfw = data['is_nsfw']
 
     def refresh_base_info(self, itch_api_key):
         url = 'https://api.itch.io/games/' + str(self.game_id)
         print("\n[refresh_base_info] URL: " + url + "\n")
-        with make_request("get", url, headers={'Authorization': itch_api_key}, allow_redirects=True) as response:
+        with make_request("get", url, itch_api_key=itch_api_key, allow_redirects=True) as response:
             if response.status_code == 400 or response.status_code == 404:
                 return
             game = json.loads(response.text)
@@ -283,145 +634,144 @@ class Game(Base):
                 self.thumb_url = game['game']['cover_url']
 
     def refresh_version(self, itch_api_key, force: bool = False):
-        url = f'https://api.itch.io/games/{self.game_id}/uploads'
-        print(f"\n[refresh_version] URL: {url}\n")
-        with make_request("get", url, headers={'Authorization': itch_api_key}, allow_redirects=True) as response:
-            if response.status_code == 400 or response.status_code == 404:
-                print(f"\n[refresh_version] Status 400, disabling game ID {self.id}\n")
-                self.is_visible = False
-                return
-
-            seen_uploads = self.uploads or {}
-            uploads_data = json.loads(response.text)
-
-            if 'uploads' not in uploads_data:
-                print("\n[refresh_version] No uploads found in response\n")
-                return
+        with Game.fetch_uploads(self.game_id, itch_api_key) as response:
+            self.update_from_uploads(itch_api_key, response, force)
 
-            has_changes = False
-            candidate_uploads = []
-
-            is_windows = False
-            is_linux = False
-            is_mac = False
-            is_android = False
-            is_web = False
-
-            for upload in uploads_data['uploads']:
-                file_id = str(upload['id'])
-                current_filename = upload['filename']
-                current_display_name = upload.get('display_name')
-                current_md5 = upload.get('md5_hash')
-                current_updated_at = upload['updated_at']
-                current_build_id = upload.get('build_id')
-                current_build = upload.get('build', {})
-                current_user_version = current_build.get('user_version')
-                current_build_updated_at = current_build.get('updated_at')
-
-                # Update platform flags
-                if 'traits' in upload:
-                    if 'p_windows' in upload['traits']:
-                        is_windows = True
-                    if 'p_linux' in upload['traits']:
-                        is_linux = True
-                    if 'p_osx' in upload['traits']:
-                        is_mac = True
-                    if 'p_android' in upload['traits']:
-                        is_android = True
-                if upload['type'] == 'html':
-                    is_web = True
-
-                # Check if the upload is new or changed
-                is_new_or_changed = (
-                        file_id not in seen_uploads or
-                        seen_uploads[file_id].get('md5_hash') != current_md5 or
-                        seen_uploads[file_id].get('updated_at') != current_updated_at or
-                        seen_uploads[file_id].get('build_id') != current_build_id or
-                        seen_uploads[file_id].get('build_updated_at') != current_build_updated_at
-                )
-
-                if is_new_or_changed:
-                    has_changes = True
-                    seen_uploads[file_id] = {
-                        'display_name': current_display_name,
-                        'md5_hash': current_md5,
-                        'updated_at': current_updated_at,
-                        'build_id': current_build_id,
-                        'build_updated_at': current_build_updated_at,
-                        'user_version': current_user_version,
-                        'filename': current_filename
-                    }
-                    candidate_uploads.append(upload)
-
-            self.uploads = seen_uploads
-
-            if not has_changes and not force:
-                return
+    @staticmethod
+    def fetch_uploads(game_id, itch_api_key):
+        """Fetch the uploads of a game from the itch.io API"""
+        url = f'https://api.itch.io/games/{game_id}/uploads'
+        print(f"\n[refresh_version] URL: {url}\n")
+        return make_request("get", url, itch_api_key=itch_api_key, allow_redirects=True)
+
+    def update_from_uploads(self, itch_api_key, response, force: bool = False):
+        """Record new or changed uploads and create a new version for the best candidate upload"""
+        if response.status_code == 400 or response.status_code == 404:
+            print(f"\n[refresh_version] Status 400, disabling game ID {self.id}\n")
+            self.is_visible = False
+            return
+
+        seen_uploads = self.uploads or {}
+        uploads_data = json.loads(response.text)
+
+        if 'uploads' not in uploads_data:
+            print("\n[refresh_version] No uploads found in response\n")
+            return
+
+        has_changes = False
+        candidate_uploads = []
+
+        is_windows = False
+        is_linux = False
+        is_mac = False
+        is_android = False
+        is_web = False
+
+        for upload in uploads_data['uploads']:
+            file_id = str(upload['id'])
+            current_filename = upload['filename']
+            current_display_name = upload.get('display_name')
+            current_md5 = upload.get('md5_hash')
+            current_updated_at = upload['updated_at']
+            current_build_id = upload.get('build_id')
+            current_build = upload.get('build', {})
+            current_user_version = current_build.get('user_version')
+            current_build_updated_at = current_build.get('updated_at')
+
+            # Update platform flags
+            if 'traits' in upload:
+                if 'p_windows' in upload['traits']:
+                    is_windows = True
+                if 'p_linux' in upload['traits']:
+                    is_linux = True
+                if 'p_osx' in upload['traits']:
+                    is_mac = True
+                if 'p_android' in upload['traits']:
+                    is_android = True
+            if upload['type'] == 'html':
+                is_web = True
+
+            # Check if the upload is new or changed
+            is_new_or_changed = (
+                    file_id not in seen_uploads or
+                    seen_uploads[file_id].get('md5_hash') != current_md5 or
+                    seen_uploads[file_id].get('updated_at') != current_updated_at or
+                    seen_uploads[file_id].get('build_id') != current_build_id or
+                    seen_uploads[file_id].get('build_updated_at') != current_build_updated_at
+            )
 
-            candidate_uploads.sort(key=lambda u: (
-                'p_linux' in u.get('traits', []),
-                'p_windows' in u.get('traits', []),
-                u['filename'].lower().endswith('.zip'),
-                datetime.datetime.fromisoformat(u['updated_at'].replace('Z', '+00:00')),
-                datetime.datetime.fromisoformat(
-                    u.get('build', {}).get('updated_at', '1970-01-01T00:00:00Z').replace('Z', '+00:00')
-                ),
-            ), reverse=True)
-            upload_to_process = candidate_uploads[0] if candidate_uploads else None
-
-            if upload_to_process:
-                new_version = self.extract_version(upload_to_process)
-                upload_timestamp = datetime.datetime.fromisoformat(
-                    upload_to_process['updated_at'].replace('Z', '+00:00'))
-
-                with Session() as session:
-                    existing_version = session.query(GameVersion) \
-                        .filter(GameVersion.game_id == self.id) \
-                        .filter(GameVersion.is_latest == True) \
-                        .filter(GameVersion.version == new_version) \
-                        .first()
-
-                    if not existing_version or force:
-                        # Get script stats for the selected upload
-                        stats = self.get_script_stats(itch_api_key, upload_to_process)
-
-                        # Update the game's info & devlog link
-                        time.sleep(10)
-                        self.refresh_tags_and_rating()
-
-                        # Create new version
-                        game_version = GameVersion(
+            if is_new_or_changed:
+                has_changes = True
+                seen_uploads[file_id] = {
+                    'display_name': current_display_name,
+                    'md5_hash': current_md5,
+                    'updated_at': current_updated_at,
+                    'build_id': current_build_id,
+                    'build_updated_at': current_build_updated_at,
+                    'user_version': current_user_version,
+                    'filename': current_filename
+                }
+                candidate_uploads.append(upload)
+
+        self.uploads = seen_uploads
+
+        if not has_changes and not force:
+            return
+
+        candidate_uploads.sort(key=lambda u: (
+            'p_linux' in u.get('traits', []),
+            'p_windows' in u.get('traits', []),
+            u['filename'].lower().endswith('.zip'),
+            datetime.datetime.fromisoformat(u['updated_at'].replace('Z', '+00:00')),
+            datetime.datetime.fromisoformat(
+                u.get('build', {}).get('updated_at', '1970-01-01T00:00:00Z').replace('Z', '+00:00')
+            ),
+        ), reverse=True)
+        upload_to_process = candidate_uploads[0] if candidate_uploads else None
+
+        if upload_to_process:
+            new_version = self.extract_version(upload_to_process)
+            upload_timestamp = datetime.datetime.fromisoformat(
+                upload_to_process['updated_at'].replace('Z', '+00:00'))
+
+            with Session() as session:
+                existing_version = find_latest_version(session, self.id, new_version)
+
+                if not existing_version or force:
+                    # Reuse script stats if identical contents were analysed before
+                    stats = get_cached_script_stats(session, upload_to_process)
+
+                    # Update the game's info & devlog link
+                    self.refresh_tags_and_rating()
+
+                    # Create new version
+                    game_version = GameVersion(
+                        game_id=self.id,
+                        version=new_version,
+                        devlog=self.devlog,
+                        is_windows=is_windows,
+                        is_linux=is_linux,
+                        is_mac=is_mac,
+                        is_android=is_android,
+                        is_web=is_web,
+                        published_at=upload_timestamp,
+                        rating=self.rating,
+                        rating_count=self.rating_count
+                    )
+                    session.add(game_version)
+                    session.flush()
+                    set_latest_version(session, game_version)
+
+                    if stats is not None:
+                        store_version_stats(session, self, game_version.id, stats)
+                    else:
+                        # Download & script analysis happen in the analysis worker pool
+                        session.add(PendingAnalysis(
+                            game_version_id=game_version.id,
                             game_id=self.id,
-                            version=new_version,
-                            devlog=self.devlog,
-                            is_windows=is_windows,
-                            is_linux=is_linux,
-                            is_mac=is_mac,
-                            is_android=is_android,
-                            is_web=is_web,
-                            published_at=upload_timestamp,
-                            rating=self.rating,
-                            rating_count=self.rating_count
-                        )
-                        session.add(game_version)
-                        session.flush()
-
-                        # Process statistics for each language
-                        if stats and 'languages' in stats:
-                            for lang_key, lang_data in stats['languages'].items():
-                                if lang_key == 'default' and self.source_language_id:
-                                    iso_code = self.source_language_id
-                                else:
-                                    iso_code = map_language_code(session, lang_key)
-                                process_language_stats(session, game_version.id, iso_code, lang_data, self.id)
-
-                        else:
-                            version_stats = VersionLanguageStats(
-                                game_version_id=game_version.id,
-                                iso_code='eng'
-                            )
-                            session.add(version_stats)
-                        session.commit()
+                            upload=upload_to_process
+                        ))
+                    session.commit()
 
     def extract_version(self, upload):
         """Extract version information from upload metadata."""
@@ -518,9 +868,10 @@ class Game(Base):
         timestamp = datetime.datetime.fromisoformat(upload['updated_at'].replace('Z', '+00:00'))
         return timestamp.strftime("%Y.%m.%d")
 
-    def get_script_stats(self, itch_api_key, upload_info):
+    def get_script_stats(self, itch_api_key, upload_info, previous_files=None):
         """
-        Extract script statistics from a game archive, including language and character stats
+        Extract script statistics from a game archive, including language and character stats.
+        `previous_files` are the per-file stats of an earlier version, unchanged files aren't counted again.
         """
         empty_stats = {
             'languages': {}
@@ -530,11 +881,15 @@ class Game(Base):
         if self.game_engine != "Ren'Py" and self.game_engine != "unknown":
             return empty_stats
 
+        if (upload_info.get('size') or 0) > MAX_DOWNLOAD_SIZE:
+            print(f"\n[get_script_stats] Upload {upload_info['id']} exceeds download limit, skipping\n")
+            return empty_stats
+
         url = self.url + '/file/' + str(upload_info['id'])
         print("\n[get_script_stats] URL: " + url + "\n")
 
         # Download the game
-        with make_request("post", url, headers={'Authorization': itch_api_key}) as response:
+        with make_request("post", url, itch_api_key=itch_api_key) as response:
             if response.status_code == 400 or response.status_code == 404:
                 return empty_stats
 
@@ -543,12 +898,10 @@ class Game(Base):
                 return empty_stats
 
             print("\n[get_script_stats] Download response: " + download['url'] + "\n")
-            download_path = 'tmp/' + upload_info['filename']
+            download_path = f'tmp/{upload_info["id"]}-{upload_info["filename"]}'
             try:
-                file = make_request("get", download['url'], allow_redirects=True)
-                if response.status_code == 400 or response.status_code == 404:
+                if not download_file(download['url'], download_path, upload_info.get('md5_hash')):
                     return empty_stats
-                open(download_path, 'wb').write(file.content)
             except RequestException as error:
                 self.error = str(error)
                 if os.path.isfile(download_path):
@@ -559,22 +912,7 @@ class Game(Base):
 
             # Handle different archive formats
             try:
-                if download_path.endswith('.zip'):
-                    try:
-                        with zipfile.ZipFile(download_path, 'r') as zip_ref:
-                            zip_ref.extractall(extract_directory)
-                    except (zipfile.BadZipfile, IOError, EOFError) as error:
-                        base = os.path.splitext(download_path)[0]
-                        os.rename(download_path, base + '.tar.bz2')
-                        download_path = base + '.tar.bz2'
-
-                if download_path.endswith('.tar.gz'):
-                    with tarfile.open(download_path) as tar:
-                        tar.extractall(extract_directory)
-                elif download_path.endswith('.tar.bz2'):
-                    with tarfile.open(download_path, "r:bz2") as tar:
-                        tar.extractall(extract_directory)
-
+                download_path = extract_archive(download_path, extract_directory)
             except (tarfile.ReadError, IOError, EOFError) as error:
                 if os.path.isfile(download_path):
                     os.remove(download_path)
@@ -599,32 +937,13 @@ class Game(Base):
                 if not game_dir_files or not os.path.isdir(os.path.join(game_dir, "game")):
                     return empty_stats
 
-                # Copy necessary Ren'Py files
-                shutil.copyfile('./renpy/wordcounter.rpy', os.path.join(game_dir, 'game', 'wordcounter.rpy'))
-
-                if not any(os.path.isdir(os.path.join(game_dir, 'lib', d)) for d in
-                           ['py2-linux-x86_64', 'py3-linux-x86_64', 'linux-x86_64']):
-                    shutil.copyfile('./renpy/renpy.py', os.path.join(game_dir, 'renpy.py'))
-                    shutil.copyfile('./renpy/renpy.sh', os.path.join(game_dir, 'renpy.sh'))
-                    shutil.copytree('./renpy/py3-linux-x86_64', os.path.join(game_dir, 'lib', 'py3-linux-x86_64'),
-                                    dirs_exist_ok=True)
-                    game_dir_files = os.listdir(game_dir)
-
-                # Execute the script
-                for game_dir_file in game_dir_files:
-                    if game_dir_file.endswith('.sh'):
-                        subprocess.run('chmod -R +x *', cwd=game_dir, shell=True)
-                        subprocess.run(f'./{quote(game_dir_file)} game test', cwd=game_dir, shell=True)
-
-                        stats_path = os.path.join(game_dir, 'stats.json')
-                        if not os.path.isfile(stats_path):
-                            continue
-
-                        with open(stats_path) as stats_file:
-                            stats = json.load(stats_file)
-                            if stats and 'languages' in stats:
-                                self.game_engine = "Ren'Py"
-                                return stats
+                # Count the .rpy sources directly, the engine is only needed for compiled-only games
+                stats = count_game_directory(os.path.join(game_dir, 'game'), previous_files)
+                if stats is None:
+                    stats = run_renpy_wordcounter(game_dir, game_dir_files)
+                if stats and 'languages' in stats:
+                    self.game_engine = "Ren'Py"
+                    return stats
 
             finally:
                 # Cleanup
@@ -638,6 +957,11 @@ class Game(Base):
 
 class GameVersion(Base):
     __tablename__ = 'game_versions'
+    __table_args__ = (
+        # Recent version history of a game for its next check time, also finds the flagged latest version
+        # when set_latest_version moves is_latest. Latest version reads go through latest_game_version.
+        Index('ix_game_versions_game_id_published_at', 'game_id', 'published_at'),
+    )
 
     id = Column(BigInteger, (Identity()), primary_key=True)
     game_id = Column(Integer, nullable=False)
@@ -674,11 +998,21 @@ class GameVersion(Base):
         self.rating_count = rating_count
         self.is_latest = is_latest
 
+
+class LatestGameVersion(Base):
+    """One row per game pointing at its latest version, maintained by set_latest_version"""
+    __tablename__ = 'latest_game_version'
+
+    game_id = Column(Integer, ForeignKey('games.id', ondelete='CASCADE'), primary_key=True)
+    game_version_id = Column(BigInteger, ForeignKey('game_versions.id', ondelete='CASCADE'), nullable=False, unique=True)
+    created_at = Column(DateTime, index=True)  # Of the version, for the notification scan
+
+
 class User(Base):
     __tablename__ = 'discord_users'
 
     id = Column(Integer, primary_key=True)
-    discord_id = Column(String(100), nullable=False)
+    discord_id = Column(String(100), nullable=False, index=True)
     processed_at = Column(DateTime, nullable=False)
 
     def __init__(self, discord_id, processed_at):
@@ -734,66 +1068,6 @@ class Rating(Base):
         self.is_visible = is_visible
         self.is_reviewed = (review != '')
 
-    @staticmethod
-    @retry(wait=wait_exponential(multiplier=2, min=30, max=120))
-    def get_request_session():
-        global request_session
-
-        # Try to load existing session with cookies
-        if os.path.exists(COOKIES_FILE):
-            with open(COOKIES_FILE, 'rb') as f:
-                cookies = pickle.load(f)
-                request_session = requests.Session()
-                request_session.cookies.update(cookies)
-
-                # Verify the session is still valid with a test request
-                try:
-                    test_response = request_session.get('https://itch.io/dashboard', timeout=5)
-                    if test_response.status_code == 200 and 'login' not in test_response.url:
-                        return request_session
-                except:
-                    pass
-
-        # If no valid session exists, create a new one
-        if request_session is None:
-            print("\n[get_request_session] Attempting Login\n")
-
-            ITCH_USER = os.environ['ITCH_USER']
-            ITCH_PASSWORD = os.environ['ITCH_PASSWORD']
-
-            request_session = requests.Session()
-
-            # Get CSRF token
-            url = "https://itch.io/login"
-            time.sleep(10)
-            login = request_session.get(url, timeout=5)
-            if login.status_code != 200:
-                raise RequestException("Status code not 200, retrying")
-
-            soup = BeautifulSoup(login.text, "html.parser")
-            csrf_token = soup.find("input", {"name": "csrf_token"})["value"]
-
-            # Login
-            time.sleep(10)
-            response = request_session.post(
-                url,
-                data={
-                    "username": ITCH_USER,
-                    "password": ITCH_PASSWORD,
-                    "csrf_token": csrf_token
-                },
-                timeout=5
-            )
-
-            if response.status_code != 200:
-                raise RequestException("Status code not 200, retrying")
-
-            # Save cookies for future use
-            with open(COOKIES_FILE, 'wb') as f:
-                pickle.dump(request_session.cookies, f)
-
-        return request_session
-
 
 class Language(Base):
     __tablename__ = 'iso_639_3_languages'
@@ -832,6 +1106,10 @@ class Language(Base):
 
 class LanguageMapping(Base):
     __tablename__ = 'language_mappings'
+    __table_args__ = (
+        # map_language_code matches keys case-insensitively
+        Index('ix_language_mappings_lower_game_language_key', text('lower(game_language_key)')),
+    )
 
     id = Column(BigInteger, Identity(), primary_key=True)
     created_at = Column(DateTime, nullable=False)
@@ -905,3 +1183,122 @@ class VersionCharacterStats(Base):
         self.words = words
         self.created_at = created_at or datetime.datetime.utcnow()
         self.updated_at = updated_at or datetime.datetime.utcnow()
+
+
+class ScriptStatsCache(Base):
+    __tablename__ = 'script_stats_cache'
+
+    id = Column(BigInteger, Identity(), primary_key=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    cache_key = Column(String(100), nullable=False, unique=True)  # md5:<hash> or build:<id>
+    languages = Column(mutable_json_type(dbtype=JSONB, nested=True), nullable=False, default={})
+
+    def __init__(self, cache_key, languages, created_at=None, updated_at=None):
+        self.cache_key = cache_key
+        self.languages = languages
+        self.created_at = created_at or datetime.datetime.utcnow()
+        self.updated_at = updated_at or datetime.datetime.utcnow()
+
+
+class PendingAnalysis(Base):
+    __tablename__ = 'pending_analyses'
+
+    id = Column(BigInteger, Identity(), primary_key=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    game_version_id = Column(Integer, ForeignKey('game_versions.id', ondelete='CASCADE'), nullable=False)
+    game_id = Column(Integer, ForeignKey('games.id', ondelete='CASCADE'), nullable=False)
+    upload = Column(JSONB, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+
+    def __init__(self, game_version_id, game_id, upload, created_at=None, updated_at=None):
+        self.game_version_id = game_version_id
+        self.game_id = game_id
+        self.upload = upload
+        self.attempts = 0
+        self.created_at = created_at or datetime.datetime.utcnow()
+        self.updated_at = updated_at or datetime.datetime.utcnow()
+
+
+class VersionFileStats(Base):
+    __tablename__ = 'version_file_stats'
+
+    id = Column(BigInteger, Identity(), primary_key=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    game_version_id = Column(Integer, ForeignKey('game_versions.id', ondelete='CASCADE'), nullable=False, index=True)
+    filename = Column(String(250), nullable=False)  # Relative to the game/ directory
+    content_hash = Column(String(32), nullable=False)
+    stats = Column(JSONB, nullable=False)
+
+    def __init__(self, game_version_id, filename, content_hash, stats, created_at=None, updated_at=None):
+        self.game_version_id = game_version_id
+        self.filename = filename
+        self.content_hash = content_hash
+        self.stats = stats
+        self.created_at = created_at or datetime.datetime.utcnow()
+        self.updated_at = updated_at or datetime.datetime.utcnow()
+
+
+class PageValidator(Base):
+    __tablename__ = 'page_validators'
+
+    id = Column(BigInteger, Identity(), primary_key=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    url = Column(String(250), nullable=False, unique=True)
+    etag = Column(String(250))
+    last_modified = Column(String(50))
+    body_digest = Column(String(32), nullable=False)
+    data = Column(JSONB, nullable=False)  # Values extracted from the page on the last visit
+
+    def __init__(self, url, etag, last_modified, body_digest, data, created_at=None, updated_at=None):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body_digest = body_digest
+        self.data = data
+        self.created_at = created_at or datetime.datetime.utcnow()
+        self.updated_at = updated_at or datetime.datetime.utcnow()
+
+    @classmethod
+    def from_response(cls, url, response, data):
+        return cls(
+            url=url,
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified'),
+            body_digest=hashlib.md5(response.content).hexdigest(),
+            data=data
+        )
+
+    def matches(self, response):
+        """Check whether the page is unchanged, either confirmed by the server or by an identical body"""
+        if response.status_code == 304:
+            return True
+        return self.body_digest == hashlib.md5(response.content).hexdigest()
+
+    def update(self, response, data):
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+        self.body_digest = hashlib.md5(response.content).hexdigest()
+        self.data = data
+        self.updated_at = datetime.datetime.utcnow()
+
+
+class RefreshRun(Base):
+    """How many games a nightly refresh checked, and how many requests skipping the rest saved"""
+    __tablename__ = 'refresh_runs'
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, nullable=False)
+    kind = Column(String(50), nullable=False)
+    total = Column(Integer, nullable=False)
+    due = Column(Integer, nullable=False)
+
+    def __init__(self, kind, total, due):
+        self.kind = kind
+        self.total = total
+        self.due = due
+        self.created_at = datetime.datetime.utcnow()
@@ -0,0 +1,60 @@
+"""
+Update notifications for subscribed users. All new latest versions since the oldest subscriber's
+processed_at are loaded with one query, and each user gets their slice of it. Users with the same
+window share the rendered messages.
+"""
+import bisect
+import datetime
+
+from models import Game, GameVersion, LatestGameVersion
+
+MESSAGE_LENGTH = 1600
+
+
+def fetch_new_versions(session, since):
+    """Latest versions of visible games created after since, oldest first"""
+    return session.query(
+        Game, GameVersion
+    ).join(
+        LatestGameVersion, LatestGameVersion.game_id == Game.id
+    ).join(
+        GameVersion, GameVersion.id == LatestGameVersion.game_version_id
+    ).filter(
+        Game.is_visible == True,
+        LatestGameVersion.created_at > since
+    ).order_by(
+        GameVersion.created_at, GameVersion.id
+    ).all()
+
+
+def render_messages(game_versions):
+    """Render update lines for (game, game_version) rows into messages of roughly MESSAGE_LENGTH"""
+    messages = []
+    result = f'Found {len(game_versions)} new updates:\n'
+    for game, game_version in game_versions:
+        result += f'{game.name}, Latest Version: {game_version.version}, ' \
+                  f'Last Updated At: <t:{int(datetime.datetime.timestamp(game_version.published_at))}:f> <{game.url}> | <{game_version.devlog}>\n'
+        if len(result) > MESSAGE_LENGTH:
+            messages.append(result)
+            result = ''
+    if result:
+        messages.append(result)
+    return messages
+
+
+class NotificationFeed:
+    def __init__(self, game_versions):
+        self.game_versions = sorted(game_versions, key=lambda row: row[1].created_at)
+        self.created_at = [game_version.created_at for _, game_version in self.game_versions]
+        self.rendered = {}
+
+    def messages_since(self, processed_at):
+        """Rendered messages for a user last notified at processed_at, empty if there's nothing new"""
+        start = bisect.bisect_right(self.created_at, processed_at)
+        if start == len(self.game_versions):
+            return []
+        if start not in self.rendered:
+            self.rendered[start] = render_messages(
+                sorted(self.game_versions[start:], key=lambda row: row[0].name)
+            )
+        return self.rendered[start]
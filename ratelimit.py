@@ -0,0 +1,81 @@
+import multiprocessing
+import os
+import time
+from urllib.parse import urlparse
+
+# Budgets in requests per minute
+RATE_LIMIT_API = float(os.environ.get('RATE_LIMIT_API', 6))
+RATE_LIMIT_HTML = float(os.environ.get('RATE_LIMIT_HTML', 6))
+RATE_LIMIT_DOWNLOAD = float(os.environ.get('RATE_LIMIT_DOWNLOAD', 6))
+RATE_LIMIT_BURST = int(os.environ.get('RATE_LIMIT_BURST', 1))
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` requests per second on average, with bursts of up to `capacity`
+    requests. Callers reserve their token up front, so concurrent callers queue up behind each
+    other instead of all waking up at once. The state lives in shared memory, so threads and
+    processes forked after its creation (the analysis workers) all spend the same budget.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        # Tokens and the time they were last updated, guarded by the array's lock
+        self.state = multiprocessing.Array('d', [capacity, clock()])
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds to wait before it may be used"""
+        with self.state.get_lock():
+            tokens, updated_at = self.state
+            now = self.clock()
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.rate) - 1
+            self.state[0] = tokens
+            self.state[1] = now
+            return max(0.0, -tokens / self.rate)
+
+    def acquire(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            self.sleep(wait)
+
+
+class RateLimiter:
+    """Separate request budgets for the itch.io API, itch.io HTML pages and download CDNs"""
+
+    def __init__(self, api: TokenBucket, html: TokenBucket, download: TokenBucket):
+        self.buckets = {
+            'api': api,
+            'html': html,
+            'download': download
+        }
+
+    @staticmethod
+    def category(url: str) -> str:
+        host = urlparse(url).hostname or ''
+        if host == 'api.itch.io':
+            return 'api'
+        if host == 'itch.io' or host.endswith('.itch.io'):
+            return 'html'
+        return 'download'
+
+    def acquire(self, url: str) -> None:
+        self.buckets[self.category(url)].acquire()
+
+    def drain_time(self, category: str, requests: int) -> float:
+        """Seconds it takes to send a number of requests of a category within its budget"""
+        return requests / self.buckets[category].rate
+
+    @classmethod
+    def from_environment(cls):
+        return cls(
+            api=TokenBucket(RATE_LIMIT_API / 60, RATE_LIMIT_BURST),
+            html=TokenBucket(RATE_LIMIT_HTML / 60, RATE_LIMIT_BURST),
+            download=TokenBucket(RATE_LIMIT_DOWNLOAD / 60, RATE_LIMIT_BURST)
+        )
+
+
+# Shared by all threads of a process and the analysis worker processes it forks
+rate_limiter = RateLimiter.from_environment()
@@ -0,0 +1,44 @@
+"""
+How often a game's page and uploads are worth checking, learned from its version history. Games that
+publish often are checked daily, quiet, finished or abandoned ones only every few weeks. A burst of new
+ratings (players reacting to an update) brings the next check forward.
+"""
+import datetime
+import statistics
+
+MIN_CHECK_INTERVAL = datetime.timedelta(days=1)
+MAX_CHECK_INTERVAL = datetime.timedelta(days=30)
+RELEASED_CHECK_INTERVAL = datetime.timedelta(days=14)
+# Statuses after which updates are rare, the interval is raised to at least their minimum
+STATUS_CHECK_INTERVALS = {
+    'Released': RELEASED_CHECK_INTERVAL,
+    'Abandoned': MAX_CHECK_INTERVAL,
+    'Canceled': MAX_CHECK_INTERVAL,
+}
+CADENCE_VERSIONS = 10
+RATING_ACTIVITY_THRESHOLD = 0.1
+
+
+def check_interval(status, published_at, rating_count=None, version_rating_count=None, now=None):
+    """
+    Time until the next check of a game.
+
+    published_at are the publish times of its latest versions, rating_count its current number of ratings
+    and version_rating_count the number when its latest version was recorded.
+    """
+    now = now or datetime.datetime.utcnow()
+    published_at = sorted(published_at, reverse=True)[:CADENCE_VERSIONS]
+    if not published_at:
+        return MIN_CHECK_INTERVAL
+
+    # Check about twice per typical gap between versions, and back off the longer a game stays quiet
+    gaps = [newer - older for newer, older in zip(published_at, published_at[1:])]
+    interval = statistics.median(gaps) / 2 if gaps else MIN_CHECK_INTERVAL
+    interval = max(interval, (now - published_at[0]) / 4)
+
+    interval = max(interval, STATUS_CHECK_INTERVALS.get(status, MIN_CHECK_INTERVAL))
+    if rating_count and version_rating_count is not None \
+            and int(rating_count) - int(version_rating_count) > int(version_rating_count) * RATING_ACTIVITY_THRESHOLD:
+        interval /= 2
+
+    return min(max(interval, MIN_CHECK_INTERVAL), MAX_CHECK_INTERVAL)
@@ -0,0 +1,161 @@
+"""
+Database access for the Discord bot. Synchronous SQLAlchemy work runs on a small dedicated thread pool,
+so slow queries (e.g. while the nightly jobs load Postgres) don't block the bot's event loop.
+Results are returned as plain values or detached, fully loaded objects. Game refreshes wait on the
+request budgets for a long time, they get their own pool so they can't starve the bot's queries.
+"""
+import asyncio
+import concurrent.futures
+import datetime
+import os
+
+from job_queue import queue_summary
+from models import Session, Game, User, refresh_savings, search_games
+from notifications import NotificationFeed, fetch_new_versions
+
+DB_EXECUTOR_WORKERS = int(os.environ.get('DB_EXECUTOR_WORKERS', 4))
+REFRESH_EXECUTOR_WORKERS = int(os.environ.get('REFRESH_EXECUTOR_WORKERS', 2))
+
+
+class BotRepository:
+    def __init__(self, workers: int = DB_EXECUTOR_WORKERS, refresh_workers: int = REFRESH_EXECUTOR_WORKERS):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bot-db')
+        self.refresh_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=refresh_workers, thread_name_prefix='bot-refresh'
+        )
+
+    async def run(self, function, *args, executor=None):
+        """Run a blocking function on the DB executor, or the given one"""
+        return await asyncio.get_running_loop().run_in_executor(executor or self.executor, function, *args)
+
+    async def subscribe(self, discord_id):
+        """Subscribe a user, returns False if they already were"""
+        return await self.run(self._subscribe, str(discord_id))
+
+    @staticmethod
+    def _subscribe(discord_id):
+        with Session() as session:
+            user = session.query(User) \
+                .filter(User.discord_id == discord_id) \
+                .first()
+            if user:
+                return False
+            # Start user off from point of subscription
+            session.add(User(discord_id=discord_id, processed_at=datetime.datetime.utcnow()))
+            session.commit()
+            return True
+
+    async def unsubscribe(self, discord_id):
+        """Unsubscribe a user, returns False if they weren't subscribed"""
+        return await self.run(self._unsubscribe, str(discord_id))
+
+    @staticmethod
+    def _unsubscribe(discord_id):
+        with Session() as session:
+            user = session.query(User) \
+                .filter(User.discord_id == discord_id) \
+                .first()
+            if not user:
+                return False
+            session.delete(user)
+            session.commit()
+            return True
+
+    async def search(self, term):
+        """(game, latest version) pairs matching the search term, best matches first"""
+        return await self.run(self._search, term)
+
+    @staticmethod
+    def _search(term):
+        with Session() as session:
+            return search_games(session, term)
+
+    async def notification_feed(self):
+        """
+        The subscribers as (user ID, discord ID, processed_at) tuples, the feed of updates since the oldest
+        processed_at and the time to record as processed once a user has been notified
+        """
+        return await self.run(self._notification_feed)
+
+    @staticmethod
+    def _notification_feed():
+        with Session() as session:
+            users = [(user.id, user.discord_id, user.processed_at) for user in session.query(User)]
+            start_time = datetime.datetime.utcnow()
+            if not users:
+                return users, NotificationFeed([]), start_time
+            since = min(processed_at for _, _, processed_at in users)
+            return users, NotificationFeed(fetch_new_versions(session, since)), start_time
+
+    async def mark_notified(self, user_id, processed_at):
+        await self.run(self._mark_notified, user_id, processed_at)
+
+    @staticmethod
+    def _mark_notified(user_id, processed_at):
+        with Session() as session:
+            session.query(User) \
+                .filter(User.id == user_id) \
+                .update({User.processed_at: processed_at})
+            session.commit()
+
+    async def queue_summary(self):
+        """(kind, status, count) of the jobs in the job queue"""
+        return await self.run(self._queue_summary)
+
+    @staticmethod
+    def _queue_summary():
+        with Session() as session:
+            return [tuple(row) for row in queue_summary(session)]
+
+    async def refresh_savings(self, days=7):
+        """(kind, games, due) totals of the nightly refreshes over the last days"""
+        return await self.run(self._refresh_savings, days)
+
+    @staticmethod
+    def _refresh_savings(days):
+        with Session() as session:
+            return [tuple(row) for row in refresh_savings(session, days)]
+
+    async def find_refreshable_games(self, name, force=False):
+        """IDs of visible games whose name contains name, skipping finished ones unless forced"""
+        return await self.run(self._find_refreshable_games, name, force)
+
+    @staticmethod
+    def _find_refreshable_games(name, force):
+        with Session() as session:
+            query = session.query(Game.id) \
+                .filter(Game.is_visible == True, Game.name.contains(name))
+            if not force:
+                query = query.filter(Game.status != 'Abandoned', Game.status != 'Canceled')
+            return [game_id for game_id, in query.all()]
+
+    async def refresh_game(self, game_id, itch_api_key, refresh_version=True, refresh_base_info=False,
+                           refresh_tags=False, force=False):
+        """Refresh a single game on the refresh executor, returns the error message if it failed"""
+        return await self.run(
+            self._refresh_game, game_id, itch_api_key, refresh_version, refresh_base_info, refresh_tags, force,
+            executor=self.refresh_executor
+        )
+
+    @staticmethod
+    def _refresh_game(game_id, itch_api_key, refresh_version, refresh_base_info, refresh_tags, force):
+        with Session() as session:
+            game = session.get(Game, game_id)
+            if not game:
+                return None
+            try:
+                game.error = None
+                if refresh_base_info:
+                    game.refresh_base_info(itch_api_key)
+                    session.commit()
+                if refresh_tags:
+                    game.refresh_tags_and_rating()
+                    session.commit()
+                if refresh_version:
+                    game.refresh_version(itch_api_key, force)
+                    session.commit()
+            except Exception as exception:
+                print("\n[Update Error] ", exception, "\n")
+                game.error = str(exception)
+                session.commit()
+            return game.error
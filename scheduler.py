@@ -1,17 +1,17 @@
 import datetime
 import json
-import threading
-import time
 from typing import Optional
 
-from bs4 import BeautifulSoup
-import schedule
 from sqlalchemy import Column, Integer, DateTime, desc
 
 import models
-from models import engine, Session, Base, Game, Rating
-
-Base.metadata.create_all(engine)
+from analysis import AnalysisPool
+from extractors import extract_feed_events
+from job_queue import JobWorker, count_pending, enqueue, next_daily_run
+from models import engine, Session, Base, Game, GameVersion, RefreshRun, get_page_validator
+from refresh_policy import CADENCE_VERSIONS, check_interval
+from http_client import http_client
+from ratelimit import rate_limiter
 
 
 class ProcessedEvent(Base):
@@ -28,176 +28,173 @@ class ProcessedEvent(Base):
         self.processed_at = datetime.datetime.utcnow()
 
 
-def refresh_tags_and_rating():
-    print("\n[refresh_tags_and_rating] Start\n")
-    with Session() as session:
-        games = session.query(Game).filter(Game.is_visible == True).all()
-        for game in games:
-            try:
-                game.refresh_tags_and_rating()
-                game.error = None
-            except Exception as exception:
-                print("\n[Update Error] ", exception, "\n")
-                game.error = exception
-            session.commit()
-            time.sleep(10)
-    print("\n[refresh_tags_and_rating] End\n")
+FEED_INTERVAL = datetime.timedelta(minutes=15)
+# Jobs that fan out into one job per game
+GAME_JOB_DEADLINE = 10 * 60
+# The feed is walked back to the last processed event in one job, at 6 pages per minute that's up to 360 pages
+FEED_JOB_DEADLINE = 60 * 60
+# The fan-outs run daily while next check times are set when a game's job runs, some time after its fan-out.
+# Games due before the next fan-out are checked now, otherwise a 1 day interval would only be due every other day.
+DUE_CHECK_MARGIN = datetime.timedelta(hours=12)
 
 
-def refresh_version(itch_api_key):
-    print("\n[refresh_version] Start\n")
+def enqueue_due_games(kind, games, next_check_at):
+    """
+    Queue a per-game job for every game from games(session) whose next_check_at column is due by the next
+    daily fan-out, skipping games that already have one pending
+    """
+    due_by = datetime.datetime.utcnow() + DUE_CHECK_MARGIN
+    with Session() as session:
+        rows = games(session).with_entities(Game.id, next_check_at).all()
+        due = [game_id for game_id, check_at in rows if check_at is None or check_at <= due_by]
+        queued = 0
+        for game_id in due:
+            queued += enqueue(session, kind, {'game_id': game_id}, dedupe_key=f'{kind}:{game_id}',
+                              deadline=GAME_JOB_DEADLINE)
+        session.add(RefreshRun(kind, len(rows), len(due)))
+        session.commit()
+    print(f"\n[{kind}] {len(due)} of {len(rows)} games due, queued {queued}, "
+          f"saved {len(rows) - len(due)} requests\n")
+
+
+def enqueue_watchlist_page(session, page):
+    enqueue(session, 'update_watchlist_page', {'page': page}, dedupe_key=f'update_watchlist_page:{page}',
+            deadline=GAME_JOB_DEADLINE)
+
+
+def feed_game_ids_by_url(session, events):
+    """
+    Game IDs of feed events without a game cell, looked up by their game URL. Only games in the watchlist
+    are refreshed, so games that aren't in the games table don't need to be identified.
+    """
+    game_urls = {game_url for _, game_id, game_url, _, _ in events if not game_id and game_url}
+    if not game_urls:
+        return {}
+    return dict(session.query(Game.url, Game.game_id).filter(Game.url.in_(game_urls)).all())
+
+
+def group_feed_events(events, processed_event_ids, game_ids_by_url=None):
+    """
+    Group new feed events (event_id, game_id, game_url, title, thumb_url) by game ID, skipping processed
+    events and events whose game can't be identified from game_ids_by_url
+    """
+    game_ids_by_url = game_ids_by_url or {}
+    events_by_game = {}
+    for event_id, game_id, game_url, _, _ in events:
+        if event_id in processed_event_ids:
+            continue
+        # No game cell on the event, look the ID up from the game URL
+        game_id = game_id or game_ids_by_url.get(game_url)
+        if game_id:
+            events_by_game.setdefault(game_id, []).append(event_id)
+    return events_by_game
+
+
+def next_check_at(session, game, now=None):
+    """When a game should be checked again, based on its status, version cadence and rating activity"""
+    now = now or datetime.datetime.utcnow()
+    versions = session.query(GameVersion.published_at, GameVersion.rating_count) \
+        .filter(GameVersion.game_id == game.id) \
+        .order_by(GameVersion.published_at.desc()) \
+        .limit(CADENCE_VERSIONS) \
+        .all()
+    validator = get_page_validator(session, game.url)
+    rating_count = validator.data.get('rating_count') if validator else None
+    interval = check_interval(
+        game.status,
+        [published_at for published_at, _ in versions],
+        rating_count,
+        versions[0].rating_count if versions else None,
+        now
+    )
+    return now + interval
+
+
+def update_game(game_id, update, next_check_attribute=None):
+    """
+    Run update(game) on a visible game, recording and re-raising errors so the job is retried. After a
+    successful update the game's next_check_attribute is set to its next check time.
+    """
     with Session() as session:
-        games = session \
-            .query(Game) \
-            .filter(Game.is_visible == True) \
-            .filter(Game.is_feedless == True) \
-            .order_by(Game.id) \
-            .all()
-        for game in games:
-            try:
-                game.refresh_version(itch_api_key)
-                game.error = None
-            except Exception as exception:
-                print("\n[Update Error] ", exception, "\n")
-                game.error = str(exception)
+        game = session.get(Game, game_id)
+        if not game or not game.is_visible:
+            return
+        try:
+            update(game)
+            game.error = None
+        except Exception as exception:
+            print("\n[Update Error] ", exception, "\n")
+            game.error = str(exception)
             session.commit()
-            time.sleep(10)
-    print("\n[refresh_version] End\n")
+            raise
+        if next_check_attribute:
+            setattr(game, next_check_attribute, next_check_at(session, game))
+        session.commit()
 
 
 class Scheduler:
     def __init__(self):
         self.itch_api_key = None
         self.itch_collection_id = None
-        self.request_session = None
+        self.analysis_pool = None
+        self.job_worker = None
 
-    def get_request_session(self):
-        """Get or create an authenticated request session"""
-        if self.request_session is None:
-            self.request_session = Rating.get_request_session()
-        return self.request_session
-
-    def process_feed_page(self, from_event: Optional[int] = None) -> Optional[int]:
-        """Process a single feed page and return the next page event ID if available"""
+    def fetch_feed_page(self, from_event: Optional[int] = None):
+        """Fetch a single feed page, returns its events and the next page event ID, or (None, None)"""
         url = 'https://itch.io/my-feed?filter=posts&format=json'
         if from_event:
             url += f'&from_event={from_event}'
 
         print(f"\n[process_feed_page] URL: {url}\n")
 
-        session = self.get_request_session()
+        session = http_client.cookie_session()
+        rate_limiter.acquire(url)
         response = session.get(url, timeout=30)
         if response.status_code != 200:
             print(f"\n[process_feed_page] Error: Status code {response.status_code}\n")
-            return None
+            return None, None
+        if 'login' in response.url:
+            # Cookies expired, log in again on the next run
+            http_client.invalidate_cookie_session()
+            return None, None
 
         feed_data = json.loads(response.text)
+        return extract_feed_events(feed_data['content']), feed_data.get('next_page')
+
+    def collect_feed_events(self, last_event_id: Optional[int] = None):
+        """
+        Walk the feed back to the last processed event without refreshing anything yet. Returns the new
+        events, newest first, and the number of pages read.
+        """
+        events = []
+        pages = 0
+        current_page = None
+        while True:
+            page_events, next_page = self.fetch_feed_page(current_page)
+            if page_events is None:
+                break
+            pages += 1
 
-        # Parse the content with BeautifulSoup
-        soup = BeautifulSoup(feed_data['content'], 'html.parser')
-
-        # Find all event rows
-        event_rows = soup.find_all("div", {"class": "event_row"})
-
-        with Session() as db_session:
-            # Get highest processed event ID once before the loop
-            highest_processed = db_session.query(ProcessedEvent) \
-                .order_by(desc(ProcessedEvent.event_id)) \
-                .first()
-            highest_event_id = highest_processed.event_id if highest_processed else None
-
-            for event_row in event_rows:
-                # Get event ID from the like button
-                like_btn = event_row.find("span", {"class": "like_btn"})
-                if not like_btn or 'data-like_url' not in like_btn.attrs:
-                    continue
-
-                event_id = int(like_btn['data-like_url'].split('/')[-2])
-
-                # If we've reached an event ID that's lower than or equal to our highest processed ID,
-                # we can stop processing entirely
-                if highest_event_id and event_id <= highest_event_id:
-                    return None  # This will break the pagination loop too
-
-                # Check if we've already processed this event
-                existing_event = db_session.query(ProcessedEvent).filter_by(event_id=event_id).first()
-                if existing_event:
-                    continue
-
-                # Try to find game information from either game cell or summary
-                game_id = None
-                game_title = None
-                game_url = None
-                game_thumb_url = None
-
-                # First check game cell
-                game_cell = event_row.find("div", {"class": "game_cell"})
-                if game_cell and 'data-game_id' in game_cell.attrs:
-                    game_id = int(game_cell['data-game_id'])
-
-                    # Get game link info if available
-                    game_link = game_cell.find("a", {"class": "game_link"})
-                    if game_link:
-                        game_url = game_link.get('href')
-
-                    # Get thumbnail if available
-                    game_thumb = game_cell.find("img")
-                    if game_thumb:
-                        game_thumb_url = game_thumb.get('data-lazy_src')
-
-                # If no game cell or missing info, try summary
-                if not game_id or not game_url:
-                    short_summary = event_row.find("div", {"class": "object_short_summary"})
-                    if short_summary:
-                        game_link = short_summary.find("a")
-                        if game_link:
-                            game_url = game_link.get('href')
-                            game_title = game_link.text
-                            try:
-                                game_id = int(Rating.get_game_id(game_url))
-                            except:
-                                continue
-
-                # Skip if we couldn't get essential game info
-                if not game_id or not game_url:
-                    continue
-
-                # Get game title from summary if we didn't get it from game cell
-                if not game_title:
-                    short_summary = event_row.find("div", {"class": "object_short_summary"})
-                    if short_summary:
-                        game_link = short_summary.find("a")
-                        if game_link:
-                            game_title = game_link.text
-
-                if not game_title:
-                    continue
-
-                # Get game from database
-                game = db_session.query(Game).filter_by(game_id=game_id).first()
-
-                if not game or not game.is_visible:
-                    continue
-
-                print(f"\n[process_feed_page] Processing update for visible game {game_id}: {game.name}\n")
+            # Events are newest first, everything from the last processed event on was seen in earlier runs
+            for event in page_events:
+                if last_event_id and event[0] <= last_event_id:
+                    return events, pages
+                events.append(event)
 
-                try:
-                    game.refresh_version(self.itch_api_key)
-                    game.error = None
+            if not next_page:
+                break
 
-                    # Record that we processed this event
-                    processed_event = ProcessedEvent(event_id, game_id)
-                    db_session.add(processed_event)
-                except Exception as exception:
-                    print(f"\n[Update Error] {exception}\n")
-                    game.error = str(exception)
-                db_session.commit()
-                time.sleep(10)
+            if last_event_id and next_page <= last_event_id:
+                break
 
-        return feed_data.get('next_page')
+            current_page = next_page
+        return events, pages
 
     def process_feed(self):
-        """Process the feed starting from the last processed event"""
+        """
+        Process the feed starting from the last processed event. All new pages are collected first, then
+        every game with new posts gets a single version refresh job, most recently posted about first.
+        """
         print("\n[process_feed] Start\n")
 
         with Session() as session:
@@ -207,26 +204,47 @@ class Scheduler:
                 .first()
             last_event_id = last_processed.event_id if last_processed else None
 
-        current_page = None
-        while True:
-            next_page = self.process_feed_page(current_page)
-
-            if not next_page:
-                break
-
-            if last_event_id and next_page <= last_event_id:
-                break
-
-            current_page = next_page
-            time.sleep(30)  # Delay between pages
+        events, pages = self.collect_feed_events(last_event_id)
 
+        with Session() as db_session:
+            processed_event_ids = {
+                event_id for event_id, in db_session.query(ProcessedEvent.event_id)
+                .filter(ProcessedEvent.event_id.in_([event[0] for event in events]))
+            } if events else set()
+            events_by_game = group_feed_events(
+                events, processed_event_ids, feed_game_ids_by_url(db_session, events)
+            )
+            games = {
+                game.game_id: game
+                for game in db_session.query(Game).filter(Game.game_id.in_(list(events_by_game)))
+            } if events_by_game else {}
+
+            # Dicts keep insertion order, so games come in order of their most recent event
+            dirty_games = 0
+            for game_id, event_ids in events_by_game.items():
+                game = games.get(game_id)
+                if not game or not game.is_visible:
+                    continue
+                dirty_games += 1
+                enqueue(db_session, 'refresh_game_version', {'game_id': game.id},
+                        dedupe_key=f'refresh_game_version:{game.id}', deadline=GAME_JOB_DEADLINE)
+                # Record that we processed these events, the refresh itself is retried by the job queue. Only a
+                # pending refresh absorbs the new one, a running refresh may have fetched the uploads already.
+                db_session.add_all([ProcessedEvent(event_id, game_id) for event_id in event_ids])
+            db_session.commit()
+
+            backlog = count_pending(db_session, 'refresh_game_version')
+
+        drain_time = datetime.timedelta(seconds=round(rate_limiter.drain_time('api', backlog)))
+        print(f"\n[process_feed] {len(events)} new events on {pages} pages, {dirty_games} games to refresh, "
+              f"{backlog} version refreshes pending, expected drain time {drain_time}\n")
         print("\n[process_feed] End\n")
 
     def update_watchlist_page(self, page: int):
         with models.make_request(
                 'get',
                 'https://api.itch.io/collections/' + self.itch_collection_id + '/collection-games?page=' + str(page),
-                headers={'Authorization': self.itch_api_key}
+                itch_api_key=self.itch_api_key
         ) as response:
             if response.status_code == 400 or response.status_code == 404:
                 return False
@@ -236,70 +254,69 @@ class Scheduler:
                 return False
 
             with Session() as session:
-                for collection_entry in collection['collection_games']:
-                    game = session.query(Game) \
-                        .filter(Game.game_id == collection_entry['game']['id']) \
-                        .first()
-
-                    should_load_details = False
-
-                    # Update if already in DB
-                    if game:
-                        if not game.is_visible:
-                            game.updated_at = datetime.datetime.utcnow()
-                            if not game.source_language_id:
-                                game.source_language_id = 'eng'
-                            should_load_details = True
-                        if collection_entry['game'].get('title') != game.name \
-                                or collection_entry['game'].get('short_text') != game.description \
-                                or collection_entry['game'].get('cover_url') != game.thumb_url:
-                            game.name = collection_entry['game'].get('title')
-                            game.description = collection_entry['game'].get('short_text')
-                            game.thumb_url = collection_entry['game'].get('cover_url')
-                            game.updated_at = datetime.datetime.utcnow()
-                        if game.initially_published_at is None:
-                            game.initially_published_at = datetime.datetime.fromisoformat(
-                                collection_entry['game']['published_at']
-                            )
-                            game.updated_at = datetime.datetime.utcnow()
-                    else:
-                        game = Game(
-                            initially_published_at=datetime.datetime.fromisoformat(
-                                collection_entry['game']['published_at']
-                            ),
-                            game_id=collection_entry['game']['id'],
-                            name=collection_entry['game']['title'],
-                            description=collection_entry['game'].get('short_text'),
-                            url=collection_entry['game']['url'],
-                            thumb_url=collection_entry['game'].get('cover_url'),
-                            source_language_id='eng'
-                        )
-                        session.add(game)
-                        session.flush()
-                        should_load_details = True
-
-                    # Load full details if needed
-                    if should_load_details:
-                        try:
-                            game.is_visible = True
-                            game.load_full_details(self.itch_api_key)
-                        except Exception as e:
-                            print(f"Failed to load full details for game {game.id}: {str(e)}")
-                    session.commit()
-
-                    time.sleep(10)  # Rate limiting between games
+                needs_details = models.sync_collection_games(session, collection['collection_games'])
+                session.flush()
+
+                # Full details of new or unhidden games are loaded by separate jobs
+                for game in needs_details:
+                    enqueue(session, 'load_game_details', {'game_id': game.id},
+                            dedupe_key=f'load_game_details:{game.id}', deadline=GAME_JOB_DEADLINE)
+                # The next page is its own job, committed along with this one's results
+                enqueue_watchlist_page(session, page + 1)
+                session.commit()
             return True
 
     def update_watchlist(self):
         print("\n[update_watchlist] Start\n")
-        page = 0
-        while True:
-            page += 1
-            has_more = self.update_watchlist_page(page)
-            if not has_more:
-                break
-            time.sleep(30)
-        print("\n[update_watchlist] End\n")
+        with Session() as session:
+            enqueue_watchlist_page(session, 1)
+            session.commit()
+
+    def refresh_game_tags(self, payload):
+        update_game(payload['game_id'], lambda game: game.refresh_tags_and_rating(), 'next_page_check_at')
+
+    def refresh_game_version(self, payload):
+        update_game(payload['game_id'], lambda game: game.refresh_version(self.itch_api_key), 'next_version_check_at')
+
+    def load_game_details(self, payload):
+        update_game(payload['game_id'], lambda game: game.load_full_details(self.itch_api_key))
+
+    def job_handlers(self):
+        return {
+            'process_feed': lambda payload: self.process_feed(),
+            'update_watchlist': lambda payload: self.update_watchlist(),
+            'update_watchlist_page': lambda payload: self.update_watchlist_page(payload['page']),
+            'refresh_tags_and_rating': lambda payload: enqueue_due_games(
+                'refresh_game_tags',
+                lambda session: session.query(Game).filter(Game.is_visible == True),
+                Game.next_page_check_at
+            ),
+            # Once a day, check games that don't use feed updates and are due
+            'refresh_version': lambda payload: enqueue_due_games(
+                'refresh_game_version',
+                lambda session: session.query(Game)
+                .filter(Game.is_visible == True, Game.is_feedless == True)
+                .order_by(Game.id),
+                Game.next_version_check_at
+            ),
+            'refresh_game_tags': self.refresh_game_tags,
+            'refresh_game_version': self.refresh_game_version,
+            'load_game_details': self.load_game_details,
+        }
+
+    @staticmethod
+    def periodic_jobs():
+        return {
+            'process_feed': lambda: datetime.datetime.utcnow() + FEED_INTERVAL,  # Feed-based updates
+            'update_watchlist': lambda: next_daily_run(0),
+            'refresh_tags_and_rating': lambda: next_daily_run(3),
+            'refresh_version': lambda: next_daily_run(6),
+        }
+
+    @staticmethod
+    def periodic_deadlines():
+        # The other periodic jobs only queue per-game or per-page jobs and end quickly
+        return {'process_feed': FEED_JOB_DEADLINE}
 
     def run(
             self,
@@ -308,20 +325,24 @@ class Scheduler:
     ) -> None:
         self.itch_api_key = itch_api_key
         self.itch_collection_id = itch_collection_id
+        Base.metadata.create_all(engine)
 
-        # makes our logic non-blocking
-        thread = threading.Thread(target=self.scheduler)
-        thread.start()
-
-    def scheduler(self):
-        print("\n[scheduler] Start\n")
-        schedule.every(15).minutes.do(self.process_feed)  # Feed-based updates
-        schedule.every().day.at("00:00").do(self.update_watchlist)
-        schedule.every().day.at("03:00").do(refresh_tags_and_rating)
-        # Once a day, check games that don't use feed updates
-        schedule.every().day.at("06:00").do(refresh_version, self.itch_api_key)
-        while True:
-            # Checks whether a scheduled task
-            # is pending to run or not
-            schedule.run_pending()
-            time.sleep(30)
\ No newline at end of file
+        # Script analysis runs in its own process pool, fed from the pending_analyses table
+        self.analysis_pool = AnalysisPool(itch_api_key)
+        self.analysis_pool.run()
+
+        # Scheduled and per-game jobs run from the queued_jobs table, in background threads
+        self.job_worker = JobWorker(self.job_handlers(), self.periodic_jobs(), self.periodic_deadlines())
+        self.job_worker.run()
+
+    def run_worker(
+            self,
+            itch_api_key: str,
+            itch_collection_id: str
+    ) -> None:
+        """Only work on queued jobs, for additional worker processes next to the bot"""
+        self.itch_api_key = itch_api_key
+        self.itch_collection_id = itch_collection_id
+        Base.metadata.create_all(engine)
+        self.job_worker = JobWorker(self.job_handlers(), self.periodic_jobs(), self.periodic_deadlines())
+        self.job_worker.run_forever()
@@ -0,0 +1,110 @@
+import concurrent.futures
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+import analysis
+from analysis import AnalysisPool
+from models import Game, PendingAnalysis
+
+
+class FakeExecutor:
+    """Runs nothing, the test decides how each submitted analysis ends"""
+
+    def __init__(self):
+        self.submitted = []
+        self.shut_down = False
+
+    def submit(self, function, *args):
+        future = concurrent.futures.Future()
+        self.submitted.append((future, args))
+        return future
+
+    def shutdown(self, wait=True):
+        self.shut_down = True
+
+
+class TestAnalysisPool(unittest.TestCase):
+    def setUp(self):
+        self.pending = PendingAnalysis(10, 1, {'id': 100, 'md5_hash': 'abc'})
+        self.pending.id = 5
+        self.game = Game(game_id=1000, url='https://a.itch.io/game', game_engine="Ren'Py")
+        self.game.id = 1
+
+        self.session = mock.MagicMock()
+        self.session.__enter__.return_value = self.session
+        self.session.get.side_effect = lambda model, _: self.pending if model is PendingAnalysis else self.game
+        self.session.query.return_value.join.return_value.filter.return_value.order_by.return_value \
+            .limit.return_value.all.return_value = [(self.pending, self.game)]
+
+        self.executor = FakeExecutor()
+        self.pool = AnalysisPool('key', workers=2)
+        self.pool.executor = self.executor
+        self.patches = [
+            mock.patch.object(analysis, 'Session', return_value=self.session),
+            mock.patch.object(analysis, 'get_previous_file_stats', return_value={}),
+            mock.patch.object(analysis, 'cache_script_stats'),
+            mock.patch.object(analysis, 'store_version_stats'),
+            mock.patch.object(analysis, 'store_file_stats'),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def submit(self):
+        self.pool.submit_pending()
+        self.assertIn(self.pending.id, self.pool.in_flight)
+        return self.executor.submitted[-1][0]
+
+    def test_success_stores_stats(self):
+        future = self.submit()
+        stats = {'languages': {'default': {'words': 10}}, 'files': {'script.rpy': {'words': 10}}}
+        future.set_result({'stats': stats, 'game_engine': "Ren'Py", 'error': None})
+
+        self.pool.dispatch()
+
+        self.assertEqual(self.pool.in_flight, {})
+        analysis.store_version_stats.assert_called_once_with(self.session, self.game, 10, stats)
+        analysis.store_file_stats.assert_called_once_with(self.session, 10, stats['files'])
+        self.session.delete.assert_called_once_with(self.pending)
+
+    def test_download_error_is_retried(self):
+        future = self.submit()
+        future.set_result({'stats': {}, 'game_engine': "Ren'Py", 'error': 'MD5 mismatch'})
+
+        self.pool.dispatch()
+
+        self.assertEqual((self.pending.attempts, self.pending.error), (1, 'MD5 mismatch'))
+        analysis.store_version_stats.assert_not_called()
+        self.session.delete.assert_not_called()
+
+    def test_broken_pool_is_replaced(self):
+        future = self.submit()
+        future.set_exception(BrokenProcessPool('worker died'))
+        replacement = FakeExecutor()
+
+        with mock.patch.object(AnalysisPool, 'create_executor', return_value=replacement):
+            self.pool.dispatch()
+
+        self.assertTrue(self.executor.shut_down)
+        self.assertIs(self.pool.executor, replacement)
+        self.assertEqual(self.pending.attempts, 1)
+        self.session.delete.assert_not_called()
+
+    def test_storing_error_counts_as_attempt(self):
+        future = self.submit()
+        future.set_result({'stats': {'languages': {}}, 'game_engine': "Ren'Py", 'error': None})
+        analysis.store_version_stats.side_effect = ValueError('duplicate key value violates unique constraint')
+
+        self.pool.dispatch()
+
+        self.assertEqual(self.pool.in_flight, {})
+        self.assertEqual(self.pending.attempts, 1)
+        self.assertIn('duplicate key', self.pending.error)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import asyncio
+import unittest
+
+from delivery import Delivery, DeliveryQueue
+
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(f'HTTP {status}')
+        self.status = status
+
+
+class FakeChannel:
+    def __init__(self, failures=()):
+        self.sent = []
+        self.failures = list(failures)  # Outcomes of the next sends, an exception to raise or None
+
+    async def send(self, message):
+        await asyncio.sleep(0.01)
+        failure = self.failures.pop(0) if self.failures else None
+        if failure:
+            raise failure
+        self.sent.append(message)
+
+
+class TestDeliveryQueue(unittest.TestCase):
+    def setUp(self):
+        self.channels = {}
+        self.opened = []
+        self.delivered = []
+
+    async def open_dm(self, discord_id):
+        self.opened.append(discord_id)
+        return self.channels.setdefault(discord_id, FakeChannel())
+
+    async def on_delivered(self, delivery):
+        self.delivered.append(delivery.user_id)
+
+    def deliver(self, deliveries, queue=None):
+        queue = queue or DeliveryQueue(self.open_dm, self.on_delivered, concurrency=3, retry_delay=0)
+        return asyncio.run(queue.deliver(deliveries)), queue
+
+    def test_delivers_concurrently(self):
+        deliveries = [Delivery(user_id, 1000 + user_id, ['a', 'b'], None) for user_id in range(6)]
+
+        async def run():
+            queue = DeliveryQueue(self.open_dm, self.on_delivered, concurrency=3)
+            start = asyncio.get_running_loop().time()
+            failed = await queue.deliver(deliveries)
+            return failed, asyncio.get_running_loop().time() - start
+
+        failed, elapsed = asyncio.run(run())
+        self.assertEqual(failed, [])
+        self.assertEqual(sorted(self.delivered), list(range(6)))
+        self.assertEqual(self.channels[1003].sent, ['a', 'b'])
+        # 6 users with 2 messages of 10ms each, 3 at a time
+        self.assertLess(elapsed, 0.1)
+
+    def test_caches_dm_channels(self):
+        _, queue = self.deliver([Delivery(1, 1001, ['a'], None)])
+        self.deliver([Delivery(1, '1001', ['b'], None)], queue)
+        self.assertEqual(self.opened, [1001])
+        self.assertEqual(self.channels[1001].sent, ['a', 'b'])
+
+    def test_retry_resumes_after_sent_messages(self):
+        self.channels[1001] = FakeChannel()
+        self.channels[1002] = FakeChannel([None, HTTPError(500)])
+        mirror = FakeChannel()
+
+        failed, _ = self.deliver([
+            Delivery(1, 1001, ['a', 'b'], None),
+            Delivery(2, 1002, ['c', 'd'], None, mirror),
+        ])
+
+        self.assertEqual(failed, [])
+        self.assertEqual(self.channels[1002].sent, ['c', 'd'])
+        self.assertEqual(mirror.sent, ['c', 'd'])
+        self.assertEqual(sorted(self.delivered), [1, 2])
+
+    def test_failed_mirror_does_not_repeat_dm(self):
+        mirror = FakeChannel([None, HTTPError(500)])
+
+        failed, _ = self.deliver([Delivery(1, 1001, ['a', 'b'], None, mirror)])
+
+        self.assertEqual(failed, [])
+        self.assertEqual(self.channels[1001].sent, ['a', 'b'])
+        self.assertEqual(mirror.sent, ['a', 'b'])
+        self.assertEqual(self.delivered, [1])
+
+    def test_failed_user_is_not_marked(self):
+        self.channels[1002] = FakeChannel([HTTPError(403)])
+        self.channels[1003] = FakeChannel([HTTPError(500)] * 3)
+
+        failed, _ = self.deliver([
+            Delivery(1, 1001, ['a'], None),
+            Delivery(2, 1002, ['b'], None),
+            Delivery(3, 1003, ['c'], None),
+        ])
+
+        self.assertEqual(sorted(delivery.user_id for delivery in failed), [2, 3])
+        self.assertEqual(self.delivered, [1])
+        # Forbidden isn't retried, server errors are until the attempts run out
+        self.assertEqual([delivery.attempts for delivery in sorted(failed, key=lambda d: d.user_id)], [1, 3])
+
+    def test_nothing_to_deliver(self):
+        failed, _ = self.deliver([])
+        self.assertEqual(failed, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
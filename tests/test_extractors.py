@@ -0,0 +1,62 @@
+import json
+import os
+import unittest
+
+from extractors import extract_feed_events, extract_game_page
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class TestExtractFeedEvents(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(FIXTURES, 'feed_page.json')) as fixture:
+            self.feed_data = json.load(fixture)
+
+    def test_fixture_page(self):
+        events = extract_feed_events(self.feed_data['content'])
+        expected = []
+        for i in range(30):
+            if i % 5 == 4:
+                # No like button, so no event ID
+                continue
+            has_game_cell = i % 5 != 3
+            expected.append((
+                98765400 - i,
+                2000000 + i if has_game_cell else None,
+                f'https://author{i % 7}.itch.io/game-{i}',
+                f'Game Title {i}',
+                f'https://img.itch.zone/aW1nLz{i}.png' if has_game_cell else None
+            ))
+        self.assertEqual(events, expected)
+
+    def test_empty_content(self):
+        self.assertEqual(extract_feed_events(''), [])
+        self.assertEqual(extract_feed_events('  \n'), [])
+
+    def test_row_without_title(self):
+        content = '<div class="event_row"><span class="like_btn" data-like_url="/event/5/like"></span>' \
+                  '<div class="game_cell" data-game_id="7"><a class="game_link" href="https://a.itch.io/b"></a></div>' \
+                  '</div>'
+        self.assertEqual(extract_feed_events(content), [])
+
+
+class TestExtractGamePage(unittest.TestCase):
+    def test_fixture_corpus(self):
+        pages = os.path.join(FIXTURES, 'game_pages')
+        with open(os.path.join(pages, 'expected.json')) as fixture:
+            expected = json.load(fixture)
+        for filename, data in expected.items():
+            with self.subTest(page=filename), open(os.path.join(pages, filename), encoding='utf-8') as page:
+                self.assertEqual(extract_game_page(page.read()), data)
+
+    def test_empty_page(self):
+        self.assertEqual(extract_game_page(''), {
+            'status': None,
+            'devlog': None,
+            'rating': None,
+            'rating_count': None,
+            'languages': None,
+            'tags': None,
+            'authors': None,
+            'is_nsfw': False
+        })
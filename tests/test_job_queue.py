@@ -0,0 +1,165 @@
+import datetime
+import os
+import unittest
+from unittest import mock
+
+import job_queue
+from sqlalchemy.dialects import postgresql
+
+from job_queue import ClaimedJob, JobWorker, QueuedJob, claim, enqueue, finish, next_daily_run, release, retry_delay, \
+    supersede
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+
+
+class TestScheduling(unittest.TestCase):
+    def test_retry_delay(self):
+        self.assertEqual(retry_delay(1), datetime.timedelta(minutes=1))
+        self.assertEqual(retry_delay(3), datetime.timedelta(minutes=4))
+        self.assertEqual(retry_delay(20), datetime.timedelta(hours=6))
+
+    def test_next_daily_run(self):
+        now = datetime.datetime(2026, 1, 1, 12, 30, tzinfo=datetime.timezone.utc)
+        self.assertEqual(next_daily_run(18, now=now), datetime.datetime(2026, 1, 1, 18, 0))
+        self.assertEqual(next_daily_run(3, now=now), datetime.datetime(2026, 1, 2, 3, 0))
+
+    def test_release(self):
+        job = QueuedJob('test', max_attempts=2)
+        job.attempts = 1
+        release(job, 'failed')
+        self.assertEqual(job.status, 'pending')
+        self.assertGreater(job.run_at, datetime.datetime.utcnow())
+
+        job.attempts = 2
+        release(job, 'failed again')
+        self.assertEqual((job.status, job.error), ('failed', 'failed again'))
+
+        release(job)
+        self.assertEqual((job.status, job.error), ('done', None))
+
+    def test_only_pending_jobs_absorb_new_ones(self):
+        session = mock.Mock()
+        session.execute.return_value.rowcount = 1
+        enqueue(session, 'test', {'game_id': 1}, dedupe_key='test:1')
+        statement = session.execute.call_args[0][0].compile(dialect=postgresql.dialect())
+        self.assertIn('ON CONFLICT (dedupe_key) WHERE status = %(status_1)s', str(statement))
+        self.assertEqual(statement.params['status_1'], 'pending')
+
+    def test_retry_superseded_by_new_job(self):
+        job = QueuedJob('test', dedupe_key='test:1')
+        session = mock.Mock()
+        session.query.return_value.filter.return_value.first.return_value = (2,)
+        supersede(session, job)
+        self.assertEqual(job.status, 'superseded')
+
+        job = QueuedJob('test', dedupe_key='test:1')
+        session.query.return_value.filter.return_value.first.return_value = None
+        supersede(session, job)
+        self.assertEqual(job.status, 'pending')
+
+
+class TestJobWorker(unittest.TestCase):
+    def setUp(self):
+        self.session = mock.MagicMock()
+        self.session.__enter__.return_value = self.session
+
+    def test_failed_job_is_finished_with_error(self):
+        handler = mock.Mock(side_effect=ValueError('boom'))
+        worker = JobWorker({'test': handler}, session_factory=lambda: self.session)
+        job = ClaimedJob(1, 'test', {'game_id': 5}, 1, 'worker')
+        with mock.patch.object(job_queue, 'finish', return_value='pending') as finish_job:
+            worker.run_job(job)
+        handler.assert_called_once_with({'game_id': 5})
+        finish_job.assert_called_once_with(self.session, job, 'boom')
+
+    def test_periodic_job_reschedules_itself(self):
+        run_at = datetime.datetime(2026, 1, 1)
+        worker = JobWorker({'tick': mock.Mock()}, {'tick': lambda: run_at}, session_factory=lambda: self.session)
+        job = ClaimedJob(1, 'tick', {}, 1, 'worker')
+        with mock.patch.object(job_queue, 'finish', return_value='done'), \
+                mock.patch.object(job_queue, 'enqueue') as enqueue_job:
+            worker.run_job(job)
+        enqueue_job.assert_called_once_with(self.session, 'tick', dedupe_key='periodic:tick', run_at=run_at,
+                                            deadline=job_queue.JOB_DEADLINE)
+
+    def test_periodic_job_deadline(self):
+        run_at = datetime.datetime(2026, 1, 1)
+        worker = JobWorker({'walk': mock.Mock()}, {'walk': lambda: run_at}, {'walk': 3600},
+                           session_factory=lambda: self.session)
+        with mock.patch.object(job_queue, 'enqueue') as enqueue_job:
+            worker.schedule_periodic()
+        enqueue_job.assert_called_once_with(self.session, 'walk', dedupe_key='periodic:walk', run_at=run_at,
+                                            deadline=3600)
+
+    def test_retried_periodic_job_is_not_rescheduled(self):
+        worker = JobWorker({'tick': mock.Mock()}, {'tick': datetime.datetime.utcnow},
+                           session_factory=lambda: self.session)
+        with mock.patch.object(job_queue, 'finish', return_value='pending'), \
+                mock.patch.object(job_queue, 'enqueue') as enqueue_job:
+            worker.run_job(ClaimedJob(1, 'tick', {}, 1, 'worker'))
+        enqueue_job.assert_not_called()
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, 'TEST_DATABASE_URL is not set')
+class TestJobQueueDatabase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from sqlalchemy import create_engine
+        cls.engine = create_engine(TEST_DATABASE_URL)
+        QueuedJob.__table__.drop(cls.engine, checkfirst=True)
+        QueuedJob.__table__.create(cls.engine)
+
+    @classmethod
+    def tearDownClass(cls):
+        QueuedJob.__table__.drop(cls.engine)
+        cls.engine.dispose()
+
+    def setUp(self):
+        from sqlalchemy.orm import sessionmaker
+        self.Session = sessionmaker(bind=self.engine)
+        with self.Session() as session:
+            session.query(QueuedJob).delete()
+            session.commit()
+
+    def test_dedupe_and_skip_locked(self):
+        with self.Session() as session:
+            self.assertTrue(enqueue(session, 'test', {'game_id': 1}, dedupe_key='test:1'))
+            self.assertFalse(enqueue(session, 'test', {'game_id': 1}, dedupe_key='test:1'))
+            self.assertTrue(enqueue(session, 'test', {'game_id': 2}, dedupe_key='test:2'))
+            session.commit()
+
+        with self.Session() as first, self.Session() as second:
+            # Hold the row lock of the first claim open while the second worker claims
+            locked = first.query(QueuedJob).order_by(QueuedJob.id).with_for_update(skip_locked=True).limit(1).first()
+            job = claim(second, 'second')
+            self.assertNotEqual(job.id, locked.id)
+            first.rollback()
+
+        with self.Session() as session:
+            self.assertEqual(finish(session, job, 'failed'), 'pending')
+            self.assertIsNone(finish(session, job))
+
+    def test_job_enqueued_while_running_waits_for_it(self):
+        with self.Session() as session:
+            self.assertTrue(enqueue(session, 'test', {'game_id': 1}, dedupe_key='test:1'))
+            session.commit()
+            running = claim(session, 'first')
+
+            # E.g. a new upload after the running refresh fetched the uploads, it needs another refresh
+            self.assertTrue(enqueue(session, 'test', {'game_id': 1}, dedupe_key='test:1'))
+            self.assertFalse(enqueue(session, 'test', {'game_id': 1}, dedupe_key='test:1'))
+            session.commit()
+            self.assertIsNone(claim(session, 'second'))
+
+            self.assertEqual(finish(session, running), 'done')
+            follow_up = claim(session, 'second')
+            self.assertNotEqual(follow_up.id, running.id)
+
+            # A failed attempt whose key has a pending job again is covered by that job
+            self.assertTrue(enqueue(session, 'test', {'game_id': 1}, dedupe_key='test:1'))
+            session.commit()
+            self.assertEqual(finish(session, follow_up, 'failed'), 'superseded')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import asyncio
+import unittest
+
+from jobs import JobRunner
+
+
+class TestJobRunner(unittest.TestCase):
+    def test_runs_items_and_reports(self):
+        processed = []
+        reports = []
+
+        async def work(item):
+            processed.append(item)
+            return 'failed' if item == 2 else None
+
+        async def report(job):
+            reports.append((job.status, job.done))
+
+        async def run():
+            runner = JobRunner(progress_interval=0)
+            job = runner.submit('test', [1, 2, 3], work, report)
+            await job.task
+            return job
+
+        job = asyncio.run(run())
+        self.assertEqual(processed, [1, 2, 3])
+        self.assertEqual((job.status, job.done, job.failed), ('done', 3, 1))
+        self.assertEqual(reports[0], ('running', 0))
+        self.assertEqual(reports[-1], ('done', 3))
+        self.assertEqual(job.summary(), 'Job #1 test: done, 3/3 done, 1 failed')
+
+    def test_cancel(self):
+        async def run():
+            runner = JobRunner()
+            started = asyncio.Event()
+            release = asyncio.Event()
+
+            async def work(item):
+                started.set()
+                await release.wait()
+
+            job = runner.submit('test', range(5), work)
+            await started.wait()
+            self.assertTrue(runner.cancel(job.id))
+            release.set()
+            await job.task
+            self.assertFalse(runner.cancel(job.id))
+            self.assertFalse(runner.cancel(99))
+            return runner, job
+
+        runner, job = asyncio.run(run())
+        self.assertEqual((job.status, job.done), ('cancelled', 1))
+        self.assertEqual(runner.list_jobs(), [job])
+
+    def test_failing_report_does_not_stop_job(self):
+        async def work(item):
+            return None
+
+        async def report(job):
+            raise RuntimeError('message deleted')
+
+        async def run():
+            job = JobRunner().submit('test', [1], work, report)
+            await job.task
+            return job
+
+        self.assertEqual(asyncio.run(run()).status, 'done')
+
+
+if __name__ == '__main__':
+    unittest.main()
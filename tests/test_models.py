@@ -1,6 +1,17 @@
+import hashlib
+import os
+import tempfile
 import unittest
 from datetime import datetime
-from models import Game
+from unittest import mock
+
+from requests import RequestException
+
+import models
+from sqlalchemy.dialects import postgresql
+
+from models import Game, GameVersion, PageValidator, select_script_members, script_stats_cache_key, \
+    set_latest_version, sync_collection_games
 
 
 class TestVersionParsing(unittest.TestCase):
@@ -146,5 +157,208 @@ class TestVersionParsing(unittest.TestCase):
             )
 
 
+class FakeStreamResponse:
+    def __init__(self, chunks, status_code=200, headers=None):
+        self.chunks = chunks
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def iter_content(self, chunk_size=1):
+        return iter(self.chunks)
+
+
+class TestDownloadFile(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.download_path = os.path.join(directory, 'game.zip')
+        self.addCleanup(lambda: os.path.isfile(self.download_path) and os.remove(self.download_path))
+
+    def download(self, response, **kwargs):
+        with mock.patch.object(models, 'make_request', return_value=response):
+            return models.download_file('http://test.com/file', self.download_path, **kwargs)
+
+    def test_streams_chunks_to_disk(self):
+        chunks = [b'abc', b'def', b'ghi']
+        md5 = hashlib.md5(b''.join(chunks)).hexdigest()
+        self.assertTrue(self.download(FakeStreamResponse(chunks), expected_md5=md5))
+        with open(self.download_path, 'rb') as downloaded:
+            self.assertEqual(downloaded.read(), b'abcdefghi')
+
+    def test_md5_mismatch(self):
+        with self.assertRaises(RequestException):
+            self.download(FakeStreamResponse([b'abc']), expected_md5='0' * 32)
+
+    def test_size_limit(self):
+        with self.assertRaises(RequestException):
+            self.download(FakeStreamResponse([b'abc', b'def']), max_size=4)
+        with self.assertRaises(RequestException):
+            self.download(FakeStreamResponse([b'abc'], headers={'Content-Length': '10'}), max_size=4)
+
+    def test_not_found(self):
+        self.assertFalse(self.download(FakeStreamResponse([], status_code=404)))
+        self.assertFalse(os.path.isfile(self.download_path))
+
+
+class TestSelectScriptMembers(unittest.TestCase):
+    def test_wrapped_archive(self):
+        names = [
+            'MyGame-1.0-pc/',
+            'MyGame-1.0-pc/MyGame.sh',
+            'MyGame-1.0-pc/MyGame.py',
+            'MyGame-1.0-pc/MyGame.exe',
+            'MyGame-1.0-pc/renpy/common/00start.rpy',
+            'MyGame-1.0-pc/lib/py3-linux-x86_64/MyGame',
+            'MyGame-1.0-pc/game/script.rpy',
+            'MyGame-1.0-pc/game/script.rpyc',
+            'MyGame-1.0-pc/game/archive.rpa',
+            'MyGame-1.0-pc/game/tl/french/script.rpy',
+            'MyGame-1.0-pc/game/images/bg.png',
+            'MyGame-1.0-pc/game/audio/theme.ogg',
+        ]
+        self.assertEqual(select_script_members(names), {
+            'MyGame-1.0-pc/MyGame.sh',
+            'MyGame-1.0-pc/MyGame.py',
+            'MyGame-1.0-pc/renpy/common/00start.rpy',
+            'MyGame-1.0-pc/lib/py3-linux-x86_64/MyGame',
+            'MyGame-1.0-pc/game/script.rpy',
+            'MyGame-1.0-pc/game/script.rpyc',
+            'MyGame-1.0-pc/game/archive.rpa',
+            'MyGame-1.0-pc/game/tl/french/script.rpy',
+        })
+
+    def test_flat_archive(self):
+        names = ['./MyGame.sh', './game/script.rpy', './game/gui/window.png', './renpy/main.py']
+        self.assertEqual(select_script_members(names), {'./MyGame.sh', './game/script.rpy', './renpy/main.py'})
+
+    def test_game_directory_only(self):
+        names = ['game/script.rpy', 'game/images/bg.png']
+        self.assertEqual(select_script_members(names), {'game/script.rpy'})
+
+
+class TestScriptStatsCacheKey(unittest.TestCase):
+    def test_cache_key(self):
+        self.assertEqual(script_stats_cache_key({'md5_hash': 'abc', 'build_id': 12}), 'md5:abc')
+        self.assertEqual(script_stats_cache_key({'md5_hash': None, 'build_id': 12}), 'build:12')
+        self.assertIsNone(script_stats_cache_key({'md5_hash': None}))
+
+
+GAME_PAGE = '''
+<html><body>
+<div class="game_info_panel_widget"><table>
+<tr><td>Status</td><td><a href="https://itch.io/games/in-development">In development</a></td></tr>
+<tr><td>Tags</td><td><a href="/t1">Visual Novel</a>, <a href="/t2">Romance</a></td></tr>
+<tr><td>Authors</td><td><a href="https://a.itch.io">A</a>, <a href="https://b.itch.io">B</a></td></tr>
+</table></div>
+<section id="devlog"><a href="https://game.itch.io/game/devlog/1">Update 1</a></section>
+<div itemprop="ratingValue" content="4.5"></div><span itemprop="ratingCount" content="12"></span>
+</body></html>
+'''
+
+
+class FakePageResponse:
+    def __init__(self, text, status_code=200, headers=None):
+        self.text = text
+        self.content = text.encode('utf-8')
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class TestGamePageValidator(unittest.TestCase):
+    def setUp(self):
+        self.game = Game(game_id=1, name="Test Game", url="http://test.com")
+
+    def test_parse_and_store_validator(self):
+        response = FakePageResponse(GAME_PAGE, headers={'ETag': '"abc"'})
+        self.game.update_from_game_page(response)
+        self.assertEqual(self.game.status, 'In development')
+        self.assertEqual(self.game.tags, 'Visual Novel, Romance')
+        self.assertEqual(self.game.rating, '4.5')
+        self.assertEqual(self.game.devlog, 'https://game.itch.io/game/devlog/1')
+
+        validator = PageValidator.from_response(self.game.url, response, Game.parse_game_page(GAME_PAGE))
+        self.assertEqual(validator.etag, '"abc"')
+        self.assertTrue(validator.matches(FakePageResponse('', status_code=304)))
+        self.assertTrue(validator.matches(FakePageResponse(GAME_PAGE)))
+        self.assertFalse(validator.matches(FakePageResponse(GAME_PAGE + ' ')))
+
+    def test_unchanged_page_is_not_parsed(self):
+        data = Game.parse_game_page(GAME_PAGE)
+        validator = PageValidator.from_response(self.game.url, FakePageResponse(GAME_PAGE), data)
+        with mock.patch.object(Game, 'parse_game_page') as parse_game_page:
+            self.game.update_from_game_page(FakePageResponse('', status_code=304), validator)
+        parse_game_page.assert_not_called()
+        self.assertEqual(self.game.rating_count, '12')
+        self.assertEqual(self.game.authors, data['authors'])
+
+
+def collection_entry(game_id, title, short_text=None, cover_url=None):
+    return {'game': {
+        'id': game_id,
+        'title': title,
+        'short_text': short_text,
+        'cover_url': cover_url,
+        'url': f'https://author.itch.io/game-{game_id}',
+        'published_at': '2024-01-01T00:00:00'
+    }}
+
+
+class TestSyncCollectionGames(unittest.TestCase):
+    def test_single_lookup_for_page(self):
+        visible = Game(game_id=1, name="Old Name", url="https://author.itch.io/game-1", is_visible=True)
+        visible.initially_published_at = datetime(2023, 1, 1)
+        hidden = Game(game_id=2, name="Hidden", url="https://author.itch.io/game-2")
+        hidden.initially_published_at = datetime(2023, 1, 1)
+        session = mock.Mock()
+        session.query.return_value.filter.return_value.all.return_value = [visible, hidden]
+
+        needs_details = sync_collection_games(session, [
+            collection_entry(1, "New Name"),
+            collection_entry(2, "Hidden"),
+            collection_entry(3, "Brand New", cover_url="https://img.itch.zone/3.png"),
+        ])
+
+        session.query.assert_called_once_with(Game)
+        self.assertEqual(session.query.return_value.filter.call_count, 1)
+        self.assertEqual(visible.name, "New Name")
+        self.assertEqual(len(needs_details), 2)
+        self.assertIs(needs_details[0], hidden)
+        self.assertTrue(hidden.is_visible)
+        self.assertEqual(needs_details[1].game_id, 3)
+        self.assertEqual(needs_details[1].thumb_url, "https://img.itch.zone/3.png")
+        session.add.assert_called_once_with(needs_details[1])
+        session.commit.assert_not_called()
+
+    def test_empty_page(self):
+        session = mock.Mock()
+        self.assertEqual(sync_collection_games(session, []), [])
+        session.query.assert_not_called()
+
+
+class TestSetLatestVersion(unittest.TestCase):
+    def test_upserts_projection_moves_flag_and_notifies(self):
+        game_version = GameVersion(42, '1.1', None, True, False, False, False, False, datetime(2024, 1, 1), None, None)
+        game_version.id = 7
+        game_version.created_at = datetime(2024, 1, 2)
+        session = mock.Mock()
+
+        set_latest_version(session, game_version)
+
+        upsert, notify = session.execute.call_args_list
+        sql = str(upsert[0][0].compile(dialect=postgresql.dialect()))
+        self.assertIn('INSERT INTO latest_game_version', sql)
+        self.assertIn('ON CONFLICT (game_id) DO UPDATE', sql)
+        self.assertIn('pg_notify', str(notify[0][0]))
+        self.assertEqual(notify[0][1], {'channel': 'game_versions', 'payload': '7'})
+        session.query.return_value.filter.return_value.update.assert_called_once()
+        self.assertTrue(game_version.is_latest)
+        session.commit.assert_not_called()
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,50 @@
+import datetime
+import unittest
+from types import SimpleNamespace
+
+from notifications import NotificationFeed, render_messages
+
+START = datetime.datetime(2026, 1, 1)
+
+
+def update(name, minutes):
+    game = SimpleNamespace(name=name, url=f'https://a.itch.io/{name.lower()}')
+    game_version = SimpleNamespace(
+        version='1.0',
+        devlog=None,
+        created_at=START + datetime.timedelta(minutes=minutes),
+        published_at=START
+    )
+    return game, game_version
+
+
+class TestNotificationFeed(unittest.TestCase):
+    def setUp(self):
+        self.feed = NotificationFeed([update('Charlie', 30), update('Alpha', 10), update('Bravo', 20)])
+
+    def test_user_slices(self):
+        self.assertEqual(self.feed.messages_since(START), render_messages(
+            [update('Alpha', 10), update('Bravo', 20), update('Charlie', 30)]
+        ))
+        messages = self.feed.messages_since(START + datetime.timedelta(minutes=10))
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(messages[0].startswith('Found 2 new updates:\nBravo'))
+        self.assertIn('Charlie', messages[0])
+        self.assertNotIn('Alpha', messages[0])
+        self.assertEqual(self.feed.messages_since(START + datetime.timedelta(minutes=30)), [])
+
+    def test_same_window_rendered_once(self):
+        first = self.feed.messages_since(START + datetime.timedelta(minutes=12))
+        second = self.feed.messages_since(START + datetime.timedelta(minutes=15))
+        self.assertIs(first, second)
+        self.assertEqual(len(self.feed.rendered), 1)
+
+    def test_long_updates_are_split(self):
+        messages = render_messages([update(f'Game {i:03}', i) for i in range(100)])
+        self.assertGreater(len(messages), 1)
+        self.assertTrue(messages[0].startswith('Found 100 new updates:\n'))
+        self.assertEqual(sum(message.count('\n') for message in messages), 101)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import multiprocessing
+import unittest
+
+from ratelimit import RateLimiter, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_spaces_requests_by_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=0.1, capacity=1, clock=clock, sleep=clock.sleep)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(clock.sleeps, [10.0, 10.0])
+
+    def test_burst_and_refill(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, capacity=3, clock=clock, sleep=clock.sleep)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(clock.sleeps, [])
+        clock.now += 2
+        bucket.acquire()
+        bucket.acquire()
+        bucket.acquire()
+        self.assertEqual(clock.sleeps, [1.0])
+
+    def test_reservations_queue_up(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=0.5, capacity=1, clock=clock)
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0.0, 2.0, 4.0])
+
+    def test_shared_with_forked_processes(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=0.5, capacity=1, clock=clock)
+        process = multiprocessing.get_context('fork').Process(target=bucket.reserve)
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+        # The child took the only token
+        self.assertEqual(bucket.reserve(), 2.0)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_category(self):
+        self.assertEqual(RateLimiter.category('https://api.itch.io/games/1/uploads'), 'api')
+        self.assertEqual(RateLimiter.category('https://itch.io/my-feed?format=json'), 'html')
+        self.assertEqual(RateLimiter.category('https://someone.itch.io/game'), 'html')
+        self.assertEqual(RateLimiter.category('https://cdn.example.com/upload.zip'), 'download')
+
+    def test_drain_time(self):
+        limiter = RateLimiter(TokenBucket(6 / 60), TokenBucket(1), TokenBucket(1))
+        self.assertAlmostEqual(limiter.drain_time('api', 30), 300.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import datetime
+import unittest
+
+from refresh_policy import MAX_CHECK_INTERVAL, MIN_CHECK_INTERVAL, RELEASED_CHECK_INTERVAL, check_interval
+
+NOW = datetime.datetime(2026, 6, 1)
+
+
+def days_ago(*days):
+    return [NOW - datetime.timedelta(days=day) for day in days]
+
+
+class TestCheckInterval(unittest.TestCase):
+    def test_no_versions(self):
+        self.assertEqual(check_interval('In development', [], now=NOW), MIN_CHECK_INTERVAL)
+
+    def test_frequent_updates(self):
+        interval = check_interval('In development', days_ago(1, 3, 5, 7), now=NOW)
+        self.assertEqual(interval, MIN_CHECK_INTERVAL)
+
+    def test_monthly_updates(self):
+        interval = check_interval('In development', days_ago(10, 40, 70, 100), now=NOW)
+        self.assertEqual(interval, datetime.timedelta(days=15))
+
+    def test_quiet_game_backs_off(self):
+        interval = check_interval('In development', days_ago(1000, 1007, 1014), now=NOW)
+        self.assertEqual(interval, MAX_CHECK_INTERVAL)
+
+    def test_status(self):
+        self.assertEqual(check_interval('Released', days_ago(1, 2, 3), now=NOW), RELEASED_CHECK_INTERVAL)
+        self.assertEqual(check_interval('Abandoned', days_ago(1, 2, 3), now=NOW), MAX_CHECK_INTERVAL)
+
+    def test_rating_activity_checks_sooner(self):
+        published_at = days_ago(10, 40, 70, 100)
+        self.assertEqual(check_interval('In development', published_at, '105', 100, now=NOW),
+                         datetime.timedelta(days=15))
+        self.assertEqual(check_interval('In development', published_at, '150', 100, now=NOW),
+                         datetime.timedelta(days=7, hours=12))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import asyncio
+import datetime
+import threading
+import unittest
+from unittest import mock
+
+import repository
+from repository import BotRepository
+
+
+class TestBotRepository(unittest.TestCase):
+    def setUp(self):
+        self.repository = BotRepository(workers=1, refresh_workers=1)
+
+    def tearDown(self):
+        self.repository.executor.shutdown()
+        self.repository.refresh_executor.shutdown()
+
+    def test_runs_off_event_loop_thread(self):
+        async def run():
+            return await self.repository.run(threading.get_ident)
+
+        self.assertNotEqual(asyncio.run(run()), threading.get_ident())
+
+    def test_refresh_does_not_block_queries(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def refresh_game(*args):
+            started.set()
+            release.wait(5)
+
+        async def run():
+            refresh = asyncio.ensure_future(self.repository.refresh_game(1, 'key'))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+            # The only DB thread is still free while the refresh waits
+            name = await asyncio.wait_for(self.repository.run(lambda: threading.current_thread().name), 1)
+            release.set()
+            await refresh
+            return name
+
+        with mock.patch.object(BotRepository, '_refresh_game', side_effect=refresh_game):
+            self.assertTrue(asyncio.run(run()).startswith('bot-db'))
+
+    def test_subscribe(self):
+        session = mock.MagicMock()
+        session.__enter__.return_value = session
+        session.query.return_value.filter.return_value.first.return_value = None
+        with mock.patch.object(repository, 'Session', return_value=session):
+            self.assertTrue(asyncio.run(self.repository.subscribe(1234)))
+
+        user = session.add.call_args[0][0]
+        self.assertEqual(user.discord_id, '1234')
+        self.assertIsInstance(user.processed_at, datetime.datetime)
+        session.commit.assert_called_once()
+
+    def test_subscribe_existing(self):
+        session = mock.MagicMock()
+        session.__enter__.return_value = session
+        with mock.patch.object(repository, 'Session', return_value=session):
+            self.assertFalse(asyncio.run(self.repository.subscribe(1234)))
+        session.add.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import datetime
+import json
+import os
+import unittest
+from unittest import mock
+
+import scheduler
+from models import Game
+from scheduler import Scheduler, enqueue_due_games, feed_game_ids_by_url, group_feed_events
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def feed_event(event_id, game_id, game_url='https://a.itch.io/game'):
+    return event_id, game_id, game_url, 'Game', None
+
+
+class TestGroupFeedEvents(unittest.TestCase):
+    def test_groups_by_game(self):
+        events = [feed_event(10, 1), feed_event(9, 2), feed_event(8, 1), feed_event(7, 3)]
+        self.assertEqual(group_feed_events(events, {7}), {1: [10, 8], 2: [9]})
+
+    def test_resolves_missing_game_ids(self):
+        events = [feed_event(10, None, 'https://a.itch.io/known'), feed_event(9, None, 'https://a.itch.io/gone')]
+        game_ids_by_url = {'https://a.itch.io/known': 5}
+        self.assertEqual(group_feed_events(events, set(), game_ids_by_url), {5: [10]})
+
+    def test_looks_up_urls_of_events_without_game_cell(self):
+        session = mock.Mock()
+        session.query.return_value.filter.return_value.all.return_value = [('https://a.itch.io/known', 5)]
+        events = [feed_event(10, None, 'https://a.itch.io/known'), feed_event(9, 2, 'https://a.itch.io/other')]
+        self.assertEqual(feed_game_ids_by_url(session, events), {'https://a.itch.io/known': 5})
+        session.query.assert_called_once_with(Game.url, Game.game_id)
+
+    def test_no_lookup_when_all_events_have_game_cells(self):
+        session = mock.Mock()
+        self.assertEqual(feed_game_ids_by_url(session, [feed_event(10, 1)]), {})
+        session.query.assert_not_called()
+
+
+class TestProcessFeed(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(FIXTURES, 'feed_page.json')) as fixture:
+            feed_data = json.load(fixture)
+        self.events = scheduler.extract_feed_events(feed_data['content'])
+        self.games = [
+            Game(game_id=2000000, name='Game 0', url='https://author0.itch.io/game-0', is_visible=True),
+            Game(game_id=2000001, name='Game 1', url='https://author1.itch.io/game-1', is_visible=True),
+            Game(game_id=2000002, name='Game 2', url='https://author2.itch.io/game-2', is_visible=False),
+        ]
+        for number, game in enumerate(self.games):
+            game.id = number + 1
+        self.db_session = mock.MagicMock()
+        self.db_session.__enter__.return_value = self.db_session
+
+        def query(entity):
+            result = mock.MagicMock()
+            if entity is Game:
+                result.filter.return_value = self.games
+            else:
+                # Event 98765399 of game 2000001 was processed before
+                result.filter.return_value = [(98765399,)]
+            return result
+
+        self.db_session.query.side_effect = query
+        self.patches = [
+            mock.patch.object(scheduler, 'Session', return_value=self.db_session),
+            mock.patch.object(scheduler, 'feed_game_ids_by_url', return_value={}),
+            mock.patch.object(scheduler, 'count_pending', return_value=1),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def test_collect_stops_at_last_processed_event(self):
+        pages = [(self.events[:10], 98765390), (self.events[10:], None)]
+        with mock.patch.object(Scheduler, 'fetch_feed_page', side_effect=pages) as fetch_feed_page:
+            events, page_count = Scheduler().collect_feed_events(98765395)
+        self.assertEqual([event[0] for event in events], [98765400, 98765399, 98765398, 98765397])
+        self.assertEqual(page_count, 1)
+        fetch_feed_page.assert_called_once_with(None)
+
+    def test_collect_all_pages(self):
+        pages = [(self.events[:10], 98765390), (self.events[10:], None)]
+        with mock.patch.object(Scheduler, 'fetch_feed_page', side_effect=pages):
+            events, page_count = Scheduler().collect_feed_events()
+        self.assertEqual(events, self.events)
+        self.assertEqual(page_count, 2)
+
+    def test_one_refresh_job_per_visible_game(self):
+        # The same game posting twice collapses into one refresh
+        events = [self.events[0], (98765000,) + self.events[0][1:]] + self.events[1:3]
+        with mock.patch.object(Scheduler, 'collect_feed_events', return_value=(events, 2)), \
+                mock.patch.object(scheduler, 'enqueue') as enqueue:
+            Scheduler().process_feed()
+
+        enqueue.assert_called_once_with(self.db_session, 'refresh_game_version', {'game_id': 1},
+                                        dedupe_key='refresh_game_version:1', deadline=scheduler.GAME_JOB_DEADLINE)
+        recorded = [
+            (event.event_id, event.game_id)
+            for call in self.db_session.add_all.call_args_list
+            for event in call[0][0]
+        ]
+        self.assertEqual(recorded, [(98765400, 2000000), (98765000, 2000000)])
+        self.db_session.commit.assert_called_once()
+
+
+class TestUpdateWatchlist(unittest.TestCase):
+    def setUp(self):
+        self.session = mock.MagicMock()
+        self.session.__enter__.return_value = self.session
+        self.scheduler = Scheduler()
+        self.scheduler.itch_api_key = 'key'
+        self.scheduler.itch_collection_id = '123'
+
+    def request(self, collection_games):
+        response = mock.MagicMock(status_code=200, text=json.dumps({'collection_games': collection_games}))
+        response.__enter__.return_value = response
+        return mock.patch.object(scheduler.models, 'make_request', return_value=response)
+
+    def test_page_queues_next_page(self):
+        with self.request([{'game': {'id': 1}}]), \
+                mock.patch.object(scheduler, 'Session', return_value=self.session), \
+                mock.patch.object(scheduler.models, 'sync_collection_games', return_value=[]), \
+                mock.patch.object(scheduler, 'enqueue') as enqueue:
+            self.assertTrue(self.scheduler.update_watchlist_page(3))
+
+        enqueue.assert_called_once_with(self.session, 'update_watchlist_page', {'page': 4},
+                                        dedupe_key='update_watchlist_page:4', deadline=scheduler.GAME_JOB_DEADLINE)
+        self.session.commit.assert_called_once()
+
+    def test_last_page_ends_walk(self):
+        with self.request([]), mock.patch.object(scheduler, 'enqueue') as enqueue:
+            self.assertFalse(self.scheduler.update_watchlist_page(4))
+        enqueue.assert_not_called()
+
+    def test_request_uses_api_key(self):
+        with self.request([]) as make_request:
+            self.scheduler.update_watchlist_page(4)
+        self.assertEqual(make_request.call_args.kwargs['itch_api_key'], 'key')
+
+
+class TestEnqueueDueGames(unittest.TestCase):
+    def test_games_due_before_next_fan_out(self):
+        now = datetime.datetime.utcnow()
+        session = mock.MagicMock()
+        session.__enter__.return_value = session
+        games = mock.Mock()
+        games.return_value.with_entities.return_value.all.return_value = [
+            (1, None),
+            # Checked 23h40m ago by the previous fan-out's job with a 1 day interval
+            (2, now + datetime.timedelta(minutes=20)),
+            (3, now + datetime.timedelta(days=5)),
+        ]
+        with mock.patch.object(scheduler, 'Session', return_value=session), \
+                mock.patch.object(scheduler, 'enqueue', return_value=True) as enqueue:
+            enqueue_due_games('refresh_game_version', games, Game.next_version_check_at)
+
+        self.assertEqual([call[0][2] for call in enqueue.call_args_list], [{'game_id': 1}, {'game_id': 2}])
+        run = session.add.call_args[0][0]
+        self.assertEqual((run.total, run.due), (3, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
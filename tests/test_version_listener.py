@@ -0,0 +1,153 @@
+import asyncio
+import os
+import select
+import socket
+import unittest
+
+from version_listener import VersionListener, connect
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+
+
+class FakeConnection:
+    """Stands in for a psycopg2 connection, notifications are announced by writing to the other socket"""
+
+    def __init__(self):
+        self.socket, self.server = socket.socketpair()
+        self.socket.setblocking(False)
+        self.notifies = []
+        self.executed = []
+        self.closed = False
+        self.fail = False
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def execute(self, sql):
+                connection.executed.append(sql)
+
+        return Cursor()
+
+    def poll(self):
+        if self.fail:
+            raise OSError('server closed the connection')
+        for _ in self.socket.recv(1024):
+            self.notifies.append('notify')
+
+    def notify(self, count=1):
+        self.server.send(b'x' * count)
+
+    def close(self):
+        self.closed = True
+        self.socket.close()
+        self.server.close()
+
+
+class TestVersionListener(unittest.TestCase):
+    def test_coalesces_notifications(self):
+        connection = FakeConnection()
+        runs = []
+
+        async def on_versions():
+            runs.append(asyncio.get_running_loop().time())
+
+        async def run():
+            listener = VersionListener(on_versions, coalesce=0.05, connect=lambda: connection)
+            await listener.start()
+            await asyncio.sleep(0.1)
+            self.assertEqual(len(runs), 1)  # Catch-up after connecting
+
+            for _ in range(3):
+                connection.notify(2)
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.1)
+            listener.close()
+
+        asyncio.run(run())
+        self.assertEqual(connection.executed, ['LISTEN game_versions'])
+        self.assertEqual(len(runs), 2)
+        self.assertTrue(connection.closed)
+
+    def test_reconnects_after_connection_loss(self):
+        connections = [FakeConnection(), FakeConnection()]
+        connect_calls = []
+
+        def connect():
+            connect_calls.append(1)
+            return connections[len(connect_calls) - 1]
+
+        async def on_versions():
+            pass
+
+        async def run():
+            listener = VersionListener(on_versions, coalesce=0.01, connect=connect, reconnect_delay=0.01)
+            await listener.start()
+            connections[0].fail = True
+            connections[0].notify()
+            await asyncio.sleep(0.1)
+            self.assertIs(listener.connection, connections[1])
+            listener.close()
+
+        asyncio.run(run())
+        self.assertEqual(len(connect_calls), 2)
+        self.assertTrue(connections[0].closed)
+
+    def test_retries_failed_connect(self):
+        connection = FakeConnection()
+        attempts = []
+
+        def connect():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise OSError('could not connect to server')
+            return connection
+
+        async def on_versions():
+            pass
+
+        async def run():
+            listener = VersionListener(on_versions, connect=connect, reconnect_delay=0.01)
+            await listener.start()
+            self.assertIsNone(listener.connection)
+            await asyncio.sleep(0.1)
+            self.assertIs(listener.connection, connection)
+            listener.close()
+
+        asyncio.run(run())
+        self.assertEqual(len(attempts), 2)
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, 'TEST_DATABASE_URL is not set')
+class TestConnect(unittest.TestCase):
+    def test_receives_notifications(self):
+        from sqlalchemy import create_engine, text
+        engine = create_engine(TEST_DATABASE_URL)
+        connection = connect(engine)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('LISTEN game_versions')
+            with engine.begin() as sender:
+                sender.execute(text("SELECT pg_notify('game_versions', '7')"))
+
+            self.assertTrue(select.select([connection], [], [], 5)[0], 'No notification within 5s')
+            connection.poll()
+            self.assertEqual([notify.payload for notify in connection.notifies], ['7'])
+            # Detached, so closing it doesn't hand a LISTENing connection back to the pool
+            self.assertEqual(engine.pool.checkedout(), 0)
+        finally:
+            connection.close()
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from wordcounter import count_game_directory, count_game_files, count_source, logical_lines, merge_file_stats
+
+FIXTURE_GAME = os.path.join(os.path.dirname(__file__), 'fixtures', 'renpy_game', 'game')
+
+
+class TestWordCounter(unittest.TestCase):
+    def test_fixture_game(self):
+        stats = count_game_directory(FIXTURE_GAME)
+        self.assertEqual(sorted(stats.pop('files')), ['options.rpy', 'script.rpy', 'tl/french/script.rpy'])
+        self.assertEqual(stats, {
+            'languages': {
+                'default': {
+                    'blocks': 11,
+                    'words': 59,
+                    'menus': 2,
+                    'options': 6,
+                    'characters': {
+                        'e': {'display_name': 'Eileen', 'blocks': 5, 'words': 35},
+                        'narrator': {'display_name': 'Narrator', 'blocks': 2, 'words': 8},
+                        'm': {'display_name': 'Mike', 'blocks': 2, 'words': 5},
+                    }
+                },
+                'french': {
+                    'blocks': 3,
+                    'words': 13,
+                    'menus': 0,
+                    'options': 0,
+                    'characters': {
+                        'e': {'display_name': 'Eileen', 'blocks': 1, 'words': 7},
+                        'narrator': {'display_name': 'Narrator', 'blocks': 1, 'words': 4},
+                        'm': {'display_name': 'Michel', 'blocks': 1, 'words': 2},
+                    }
+                }
+            }
+        })
+
+    def test_unchanged_files_are_reused(self):
+        files = count_game_files(FIXTURE_GAME)
+        previous_files = dict(files)
+        previous_files['script.rpy'] = {
+            'hash': files['script.rpy']['hash'],
+            'stats': count_source('label start:\n    "Only two"\n')
+        }
+        previous_files['options.rpy'] = {'hash': 'outdated', 'stats': count_source('')}
+
+        stats = count_game_directory(FIXTURE_GAME, previous_files)
+        self.assertEqual(stats['files']['script.rpy'], previous_files['script.rpy'])
+        self.assertEqual(stats['files']['options.rpy'], files['options.rpy'])
+        self.assertEqual(stats['languages']['default']['words'], 2)
+
+    def test_logical_lines(self):
+        source = 'label start:\n    e "one # two" # comment\n    $ x = (1,\n        2)\n'
+        self.assertEqual(logical_lines(source), [
+            (0, 'label start:'),
+            (4, 'e "one # two"'),
+            (4, '$ x = (1,\n        2)'),
+        ])
+
+    def test_undefined_speaker_only_counts_towards_totals(self):
+        stats = merge_file_stats([count_source('label start:\n    x "Hello world"\n    narrator "Hi"\n')])
+        self.assertEqual(stats['languages']['default']['blocks'], 2)
+        self.assertEqual(stats['languages']['default']['words'], 3)
+        self.assertEqual(stats['languages']['default']['characters'], {})
+
+    def test_compiled_only_game(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shutil.copyfile(os.path.join(FIXTURE_GAME, 'script.rpy'), os.path.join(directory, 'script.rpy'))
+            open(os.path.join(directory, 'options.rpyc'), 'wb').close()
+            self.assertIsNone(count_game_directory(directory))
+
+
+if __name__ == '__main__':
+    unittest.main()
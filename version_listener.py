@@ -0,0 +1,101 @@
+"""
+Push notifications for new game versions. set_latest_version sends a NOTIFY on the game_versions channel
+in the transaction that records a version, so it's only delivered once the version is committed. The bot
+LISTENs on a dedicated connection watched by the event loop and runs its notifier once per burst.
+"""
+import asyncio
+import os
+
+from models import engine, VERSION_CHANNEL
+
+NOTIFY_COALESCE_SECONDS = float(os.environ.get('NOTIFY_COALESCE_SECONDS', 10))
+LISTEN_RECONNECT_DELAY = 30
+
+
+def connect(bind=engine):
+    """Dedicated autocommit psycopg2 connection, detached from the engine's pool"""
+    connection = bind.raw_connection()
+    # The pool forgets the DBAPI connection on detach, so it has to be taken first
+    dbapi_connection = connection.dbapi_connection
+    connection.detach()
+    dbapi_connection.autocommit = True
+    return dbapi_connection
+
+
+class VersionListener:
+    """
+    Calls the coroutine function on_versions once notifications stop arriving for coalesce seconds,
+    and after every (re)connect in case versions were recorded while the connection was down
+    """
+
+    def __init__(self, on_versions, coalesce: float = NOTIFY_COALESCE_SECONDS, connect=connect,
+                 reconnect_delay: float = LISTEN_RECONNECT_DELAY):
+        self.on_versions = on_versions
+        self.coalesce = coalesce
+        self.connect = connect
+        self.reconnect_delay = reconnect_delay
+        self.connection = None
+        self.pending = None
+        self.tasks = set()
+
+    async def start(self) -> None:
+        """LISTEN until the connection fails, then schedule a reconnect"""
+        loop = asyncio.get_running_loop()
+        try:
+            self.connection = await loop.run_in_executor(None, self.connect)
+            with self.connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {VERSION_CHANNEL}')
+        except Exception as exception:
+            print(f"\n[VersionListener] Connection failed: {exception}\n")
+            self.close()
+            loop.call_later(self.reconnect_delay, self.reconnect)
+            return
+        loop.add_reader(self.connection.fileno(), self.readable)
+        print(f"\n[VersionListener] Listening on {VERSION_CHANNEL}\n")
+        self.schedule()
+
+    def reconnect(self) -> None:
+        self.spawn(self.start())
+
+    def readable(self) -> None:
+        try:
+            self.connection.poll()
+        except Exception as exception:
+            print(f"\n[VersionListener] Connection lost: {exception}\n")
+            self.close()
+            asyncio.get_running_loop().call_later(self.reconnect_delay, self.reconnect)
+            return
+        if self.connection.notifies:
+            self.connection.notifies.clear()
+            self.schedule()
+
+    def schedule(self) -> None:
+        """Run on_versions after the coalescing window, unless a run is already scheduled"""
+        if self.pending is None:
+            self.pending = asyncio.get_running_loop().call_later(self.coalesce, self.fire)
+
+    def fire(self) -> None:
+        self.pending = None
+        self.spawn(self.on_versions())
+
+    def spawn(self, coroutine) -> None:
+        # The loop only keeps weak references to tasks
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def close(self) -> None:
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
+        if self.connection is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(self.connection.fileno())
+        except Exception:
+            pass
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+        self.connection = None
@@ -0,0 +1,449 @@
+# coding=utf-8
+"""
+Pure Python port of renpy/wordcounter.rpy.
+
+Counts say statements, words, menus and menu options per language, plus per-character stats, straight
+from the .rpy sources of a game, without booting the Ren'Py engine. The engine is only needed for games
+that ship compiled scripts (.rpyc, or scripts packed into .rpa archives) without their sources.
+"""
+
+import hashlib
+import io
+import json
+import os
+import pickle
+import re
+import shutil
+import subprocess
+import zlib
+from shlex import quote
+
+_TOKEN = re.compile(r'''
+    (?P<string>"""(?:\\.|[^\\])*?"""|\'\'\'(?:\\.|[^\\])*?\'\'\'|"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|`(?:\\.|[^`\\])*`)
+    | (?P<comment>\#[^\n]*)
+    | (?P<open>[(\[{])
+    | (?P<close>[)\]}])
+    | (?P<newline>\n)
+''', re.VERBOSE | re.DOTALL)
+
+_SIMPLE_LINE = re.compile(r'''(?P<code>[^"'`#(\[{\n]*(?:(?:"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')[^"'`#(\[{\n]*)*)(?:\#.*)?''')
+_STRING = re.compile(r'''"""(?:\\.|[^\\])*?"""|\'\'\'(?:\\.|[^\\])*?\'\'\'|"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|`(?:\\.|[^`\\])*`''',
+                     re.DOTALL)
+_ESCAPE = re.compile(r'\\(.)', re.DOTALL)
+_SAY_PREFIX = re.compile(r'^(?P<who>[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*)(?:\s+@?\s*-?[A-Za-z_0-9]\w*)*\s*@?\s*$')
+_DEFINE = re.compile(r'^define\s+(?:-?\d+\s+)?(?P<name>[A-Za-z_][\w.]*)\s*[+|]?=\s*(?P<code>.*)$', re.DOTALL)
+_CHARACTER_TRANSLATED = re.compile(r"Character\s*\(\s*_\(\s*[\"']([^\"']+)[\"']")
+_CHARACTER = re.compile(r"Character\s*\(\s*[\"']([^\"']+)[\"']")
+_TRANSLATE = re.compile(r'^translate\s+(?P<language>\w+)\s+(?P<identifier>[\w.]+)\s*:$')
+_SCRIPT_BLOCK = re.compile(r'^(?:label\b|init(?:\s+-?\d+)?\s*:$|if\b|elif\b|else\s*:$|while\b)')
+_SKIPPED_INIT = re.compile(r'^(?:init\s+(?:-?\d+\s+)?)?python\b|^early\s+python\b')
+_MENU = re.compile(r'^menu\b')
+_MONOLOGUE = re.compile(r'^rpy\s+monologue\s+(?P<mode>none|single|double)$')
+
+# First words of statements that can never be a say statement
+KEYWORDS = {
+    'call', 'camera', 'default', 'define', 'early', 'elif', 'else', 'hide', 'if', 'image', 'init', 'jump',
+    'label', 'layeredimage', 'menu', 'new', 'nvl', 'old', 'pass', 'pause', 'play', 'python', 'queue',
+    'return', 'rpy', 'scene', 'screen', 'show', 'stop', 'style', 'testcase', 'transform', 'translate',
+    'voice', 'while', 'window', 'with'
+}
+
+SCRIPT = 'script'
+MENU = 'menu'
+STRINGS = 'strings'
+SKIP = 'skip'
+
+
+def logical_lines(source):
+    """
+    Split Ren'Py source into (indent, text) logical lines, joining lines inside brackets and
+    multi-line strings, with comments removed
+    """
+    lines = []
+    position = 0
+    length = len(source)
+    while position < length:
+        end = source.find('\n', position)
+        if end == -1:
+            end = length
+
+        # Fast path for the vast majority of lines: no brackets, no strings spanning lines
+        simple = _SIMPLE_LINE.fullmatch(source, position, end)
+        if simple:
+            _append_line(lines, simple.group('code'))
+            position = end + 1
+            continue
+
+        pieces = []
+        depth = 0
+        for match in _TOKEN.finditer(source, position):
+            kind = match.lastgroup
+            if kind == 'open':
+                depth += 1
+            elif kind == 'close':
+                depth = max(0, depth - 1)
+            elif kind == 'comment' or (kind == 'newline' and depth == 0):
+                pieces.append(source[position:match.start()])
+                position = match.end()
+                if kind == 'newline':
+                    break
+        else:
+            pieces.append(source[position:])
+            position = length
+        _append_line(lines, ''.join(pieces))
+    return lines
+
+
+def _append_line(lines, text):
+    stripped = text.strip()
+    if stripped:
+        lines.append((len(text) - len(text.lstrip()), stripped))
+
+
+def decode_string(literal):
+    """Turn a string literal into its text, processing escapes the way the Ren'Py lexer does"""
+    if literal[:3] in ('"""', "'''"):
+        text = literal[3:-3]
+    else:
+        text = literal[1:-1]
+    return _ESCAPE.sub(lambda match: '\n' if match.group(1) == 'n' else match.group(1), text)
+
+
+def parse_say(text):
+    """
+    Return (who, literal) if the line is a say statement, otherwise None. `who` is None for narration,
+    and the quoted speaker for "Speaker" "What" lines, which the engine word counter doesn't attribute.
+    """
+    string = _STRING.search(text)
+    if not string:
+        return None
+
+    prefix = text[:string.start()]
+    if prefix:
+        say_prefix = _SAY_PREFIX.match(prefix)
+        if not say_prefix or say_prefix.group('who').split('.')[0] in KEYWORDS:
+            return None
+        return say_prefix.group('who'), string.group(0)
+
+    rest = text[string.end():]
+    what = _STRING.match(text, string.end() + len(rest) - len(rest.lstrip()))
+    if what:
+        return string.group(0), what.group(0)
+    return None, string.group(0)
+
+
+class FileStats:
+    """Word counter results of a single script file, before defined characters are resolved"""
+
+    def __init__(self):
+        self.defines = {}
+        self.strings = {}
+        self.languages = {}
+
+    def language(self, language):
+        if language not in self.languages:
+            self.languages[language] = {
+                'blocks': 0,
+                'words': 0,
+                'menus': 0,
+                'options': 0,
+                'characters': {}
+            }
+        return self.languages[language]
+
+    def add_say(self, language, who, what):
+        stats = self.language(language)
+        # Narration is stored under '', an explicit `narrator` only counts if the game defines it
+        character = stats['characters'].setdefault(who or '', {'blocks': 0, 'words': 0})
+        words = len(what.split())
+        stats['blocks'] += 1
+        stats['words'] += words
+        character['blocks'] += 1
+        character['words'] += words
+
+    def to_dict(self):
+        return {
+            'defines': self.defines,
+            'strings': self.strings,
+            'languages': self.languages
+        }
+
+
+def count_source(source):
+    """Count a single .rpy file, returning its FileStats as a dict"""
+    file_stats = FileStats()
+    monologue = 'double'
+    old = None
+    # Stack of (indent of the block opener, block kind, language)
+    stack = [(-1, SCRIPT, 'default')]
+
+    for indent, text in logical_lines(source.replace('\r\n', '\n').expandtabs(8)):
+        while indent <= stack[-1][0]:
+            stack.pop()
+        _, context, language = stack[-1]
+        opens_block = text.endswith(':')
+
+        if context == SKIP:
+            continue
+
+        if context == STRINGS:
+            if text.startswith(('old ', 'new ')):
+                string = _STRING.search(text)
+                if string:
+                    if text.startswith('old '):
+                        old = decode_string(string.group(0))
+                    elif old is not None:
+                        file_stats.strings.setdefault(language, {})[old] = decode_string(string.group(0))
+                        old = None
+            continue
+
+        if context == MENU:
+            say = None if opens_block else parse_say(text)
+            if say and say[0] is not None:
+                # A say statement inside a menu becomes its caption
+                _add_say(file_stats, language, say, monologue)
+            elif text[0] in '"\'`':
+                file_stats.language('default')['options'] += 1
+                if opens_block:
+                    stack.append((indent, SCRIPT, language))
+            elif opens_block:
+                stack.append((indent, SKIP, language))
+            continue
+
+        monologue_match = _MONOLOGUE.match(text)
+        if monologue_match:
+            monologue = monologue_match.group('mode')
+            continue
+
+        if text.startswith('$'):
+            continue
+
+        if opens_block:
+            translate = _TRANSLATE.match(text)
+            if _MENU.match(text):
+                file_stats.language('default')['menus'] += 1
+                stack.append((indent, MENU, language))
+            elif translate:
+                translate_language = translate.group('language')
+                if translate_language == 'None':
+                    translate_language = 'default'
+                if translate.group('identifier') == 'strings':
+                    stack.append((indent, STRINGS, translate_language))
+                elif translate.group('identifier') in ('python', 'style'):
+                    stack.append((indent, SKIP, language))
+                else:
+                    stack.append((indent, SCRIPT, translate_language))
+            elif _SCRIPT_BLOCK.match(text) and not _SKIPPED_INIT.match(text):
+                stack.append((indent, SCRIPT, language))
+            else:
+                stack.append((indent, SKIP, language))
+            continue
+
+        define = _DEFINE.match(text)
+        if define:
+            code = define.group('code').strip()
+            match = _CHARACTER_TRANSLATED.search(code) or _CHARACTER.search(code)
+            varname = define.group('name').split('.')[-1]
+            file_stats.defines[varname] = match.group(1) if match else varname
+            continue
+
+        say = parse_say(text)
+        if say:
+            _add_say(file_stats, language, say, monologue)
+
+    return file_stats.to_dict()
+
+
+def _add_say(file_stats, language, say, monologue):
+    who, literal = say
+    what = decode_string(literal)
+    if literal[:3] in ('"""', "'''") and monologue != 'none':
+        # Monologue mode turns each paragraph of a triple quoted string into its own say statement
+        separator = r'\n\s*\n' if monologue == 'double' else r'\n'
+        for block in re.split(separator, what):
+            if block.strip():
+                file_stats.add_say(language, who, block)
+    else:
+        file_stats.add_say(language, who, what)
+
+
+def merge_file_stats(files):
+    """
+    Combine per-file stats into the report_stats() format of renpy/wordcounter.rpy, resolving
+    defined characters and their translated display names across all files
+    """
+    defines = {}
+    strings = {}
+    for file_stats in files:
+        defines.update(file_stats['defines'])
+        for language, translations in file_stats['strings'].items():
+            strings.setdefault(language, {}).update(translations)
+
+    result = {'languages': {}}
+    for file_stats in files:
+        for language, data in file_stats['languages'].items():
+            report = result['languages'].setdefault(language, {
+                'blocks': 0,
+                'words': 0,
+                'menus': 0,
+                'options': 0,
+                'characters': {}
+            })
+            for key in ('blocks', 'words', 'menus', 'options'):
+                report[key] += data[key]
+
+            for character, count in data['characters'].items():
+                if character == '':
+                    character = 'narrator'
+                elif character not in defines:
+                    continue
+                if character == 'narrator':
+                    display_name = 'Narrator'
+                elif language == 'default':
+                    display_name = defines[character]
+                else:
+                    display_name = strings.get(language, {}).get(defines[character], defines[character])
+                character_report = report['characters'].setdefault(character, {
+                    'display_name': display_name,
+                    'blocks': 0,
+                    'words': 0
+                })
+                character_report['blocks'] += count['blocks']
+                character_report['words'] += count['words']
+
+    return result
+
+
+def read_rpa_index(path):
+    """Return the file names stored in a .rpa archive, or None if the format isn't understood"""
+    with open(path, 'rb') as archive:
+        header = archive.readline()
+        parts = header.split()
+        if not parts:
+            return None
+        if parts[0] == b'RPA-3.0' and len(parts) >= 3:
+            offset = int(parts[1], 16)
+        elif parts[0] == b'RPA-2.0' and len(parts) >= 2:
+            offset = int(parts[1], 16)
+        else:
+            return None
+        archive.seek(offset)
+        index = _IndexUnpickler(zlib.decompress(archive.read())).load()
+    return [name.decode('utf-8') if isinstance(name, bytes) else name for name in index]
+
+
+class _IndexUnpickler(pickle.Unpickler):
+    """Unpickler for .rpa indexes that refuses to load anything but plain containers"""
+
+    def __init__(self, data):
+        super().__init__(io.BytesIO(data), encoding='bytes')
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"Refusing to load {module}.{name} from archive index")
+
+
+def find_script_sources(game_directory):
+    """
+    Return the .rpy files of a game directory, or None if some scripts are only available compiled
+    (.rpyc without a matching .rpy, or scripts inside .rpa archives)
+    """
+    sources = []
+    for directory, _, files in os.walk(game_directory):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            lower = filename.lower()
+            if lower.endswith('.rpy'):
+                sources.append(path)
+            elif lower.endswith('.rpyc'):
+                if not os.path.isfile(path[:-1]):
+                    return None
+            elif lower.endswith('.rpa'):
+                try:
+                    names = read_rpa_index(path)
+                except (OSError, ValueError, zlib.error, pickle.UnpicklingError, EOFError):
+                    names = None
+                if names is None or any(name.lower().endswith(('.rpy', '.rpyc')) for name in names):
+                    return None
+    return sorted(sources) or None
+
+
+def count_game_files(game_directory, previous_files=None):
+    """
+    Count each .rpy source below a game/ directory, returning {filename: {'hash': ..., 'stats': ...}},
+    or None if the engine has to be used instead. Files whose content hash matches `previous_files`
+    (the result for an earlier version of the game) aren't parsed again.
+    """
+    sources = find_script_sources(game_directory)
+    if sources is None:
+        return None
+
+    previous_files = previous_files or {}
+    files = {}
+    reused = 0
+    for path in sources:
+        filename = os.path.relpath(path, game_directory).replace(os.sep, '/')
+        with open(path, 'rb') as source:
+            content = source.read()
+        content_hash = hashlib.md5(content).hexdigest()
+
+        previous = previous_files.get(filename)
+        if previous and previous['hash'] == content_hash:
+            files[filename] = previous
+            reused += 1
+            continue
+
+        files[filename] = {
+            'hash': content_hash,
+            'stats': count_source(content.decode('utf-8-sig', errors='replace'))
+        }
+
+    if previous_files:
+        print(f"\n[count_game_files] Reused {reused} of {len(files)} unchanged files\n")
+    return files
+
+
+def count_game_directory(game_directory, previous_files=None):
+    """
+    Count all .rpy sources below a game/ directory, returning stats in the report_stats() format
+    plus the per-file results under 'files', or None if the engine has to be used instead
+    """
+    files = count_game_files(game_directory, previous_files)
+    if files is None:
+        return None
+
+    stats = merge_file_stats([files[filename]['stats'] for filename in sorted(files)])
+    stats['files'] = files
+    return stats
+
+
+def run_renpy_wordcounter(game_dir, game_dir_files):
+    """
+    Boot the Ren'Py engine with renpy/wordcounter.rpy injected and return the stats it writes, if any
+    """
+    # Copy necessary Ren'Py files
+    shutil.copyfile('./renpy/wordcounter.rpy', os.path.join(game_dir, 'game', 'wordcounter.rpy'))
+
+    if not any(os.path.isdir(os.path.join(game_dir, 'lib', d)) for d in
+               ['py2-linux-x86_64', 'py3-linux-x86_64', 'linux-x86_64']):
+        shutil.copyfile('./renpy/renpy.py', os.path.join(game_dir, 'renpy.py'))
+        shutil.copyfile('./renpy/renpy.sh', os.path.join(game_dir, 'renpy.sh'))
+        shutil.copytree('./renpy/py3-linux-x86_64', os.path.join(game_dir, 'lib', 'py3-linux-x86_64'),
+                        dirs_exist_ok=True)
+        game_dir_files = os.listdir(game_dir)
+
+    # Execute the script
+    for game_dir_file in game_dir_files:
+        if game_dir_file.endswith('.sh'):
+            subprocess.run('chmod -R +x *', cwd=game_dir, shell=True)
+            subprocess.run(f'./{quote(game_dir_file)} game test', cwd=game_dir, shell=True)
+
+            stats_path = os.path.join(game_dir, 'stats.json')
+            if not os.path.isfile(stats_path):
+                continue
+
+            with open(stats_path) as stats_file:
+                stats = json.load(stats_file)
+                if stats and 'languages' in stats:
+                    return stats
+
+    return None
@@ -0,0 +1,9 @@
+# Additional job queue worker, e.g. `python3 worker.py &` a few times to drain the queue in parallel
+import os
+
+from scheduler import Scheduler
+
+ITCH_API_KEY = os.environ['ITCH_API_KEY']
+ITCH_COLLECTION_ID = os.environ['ITCH_COLLECTION_ID']
+
+Scheduler().run_worker(ITCH_API_KEY, ITCH_COLLECTION_ID)